@@ -0,0 +1,95 @@
+import os
+from itertools import product
+import numpy as np
+import pandas as pd
+from parallel_sweep import run_combos
+from result_store import PARAM_COLUMNS, STORE_FILE
+
+# 由粗到细的自适应参数搜索：不遍历完整网格，只计算最有希望的区域
+# 1. 每个参数轴按步长 stride 取约 COARSE_POINTS 个点组成粗网格
+# 2. 围绕按 METRIC 排名前 TOP_N 的点计算 ±stride 的邻居，直到前 TOP_N 的邻居都已计算（当前尺度下的局部最优）
+# 3. 步长减半重复第 2 步，步长为 1 时收敛
+# 每个计算过的点都和穷举遍历的汇总行格式相同（多 round / stride 两列），并写入结果库（见 result_store）
+CSV_FILE = 'klineData.csv'
+STRATEGY = 'V2'
+M_VALUES = list(range(4, 241, 4))
+VALUES_A = [round(v, 2) for v in np.arange(0.5, 2.001, 0.05)]     # V1: N_values；V2: z_open_values
+VALUES_B = [round(v, 2) for v in np.arange(0.05, 0.601, 0.05)]    # V1: z_open_values；V2: z_close_values
+METRIC = 'sharpe_ratio'
+COARSE_POINTS = 5
+TOP_N = 5
+MAX_ROUNDS = 50
+WORKERS = None
+OUTPUT_DIR = 'kline'
+
+
+def _axis_points(n, stride):
+    points = list(range(0, n, stride))
+    if points[-1] != n - 1:
+        points.append(n - 1)
+    return points
+
+
+def _neighbours(index, strides, shape):
+    return product(*({max(i - s, 0), i, min(i + s, n - 1)} for i, s, n in zip(index, strides, shape)))
+
+
+def adaptive_search(csv_file=CSV_FILE, strategy=STRATEGY, M_values=M_VALUES, values_a=VALUES_A, values_b=VALUES_B,
+                    metric=METRIC, coarse_points=COARSE_POINTS, top_n=TOP_N, max_rounds=MAX_ROUNDS,
+                    workers=WORKERS, store_file=STORE_FILE):
+    """
+    在 M_values x values_a x values_b 网格上做由粗到细的搜索（参数含义同 parallel_sweep.run_sweep）
+    返回所有计算过的点（DataFrame，按计算顺序；round 为第几轮，stride 为该轮各轴的步长）
+    """
+    axes = [list(M_values), list(values_a), list(values_b)]
+    shape = [len(v) for v in axes]
+    name_a, name_b = PARAM_COLUMNS[strategy]
+    strides = [max(1, (n - 1) // max(coarse_points - 1, 1)) for n in shape]
+    evaluated = {}      # 网格下标 (i, j, k) -> 汇总行，出错的组合为 None（不再重试）
+    new = list(product(*(_axis_points(n, s) for n, s in zip(shape, strides))))
+
+    for round_no in range(max_rounds):
+        if not new:
+            break
+        combos = [tuple(axes[d][i] for d, i in enumerate(index)) for index in new]
+        rows = {(r['M'], r[name_a], r[name_b]): r
+                for r in run_combos(csv_file, strategy, combos, workers, store_file=store_file)}
+        for index, combo in zip(new, combos):
+            row = rows.get(combo)
+            evaluated[index] = None if row is None else dict(row, round=round_no, stride=tuple(strides))
+
+        scored = [(index, row[metric]) for index, row in evaluated.items()
+                  if row is not None and np.isfinite(row[metric])]
+        top = [index for index, _ in sorted(scored, key=lambda x: -x[1])[:top_n]]
+        print(f"第 {round_no} 轮: 新计算 {len(new)} 组，累计 {len(evaluated)} / {int(np.prod(shape))} 组，"
+              f"步长 {strides}，当前最佳 {metric} = {evaluated[top[0]][metric] if top else float('nan'):.4f}")
+
+        new = []
+        while True:
+            candidates = {nb for index in top for nb in _neighbours(index, strides, shape)}
+            new = sorted(candidates - evaluated.keys())
+            if new or all(s == 1 for s in strides):
+                break
+            strides = [max(1, s // 2) for s in strides]
+
+    return pd.DataFrame([row for row in evaluated.values() if row is not None])
+
+
+if __name__ == "__main__":
+    grid_size = len(M_VALUES) * len(VALUES_A) * len(VALUES_B)
+    print(f"自适应搜索: {STRATEGY}，完整网格 {len(M_VALUES)} x {len(VALUES_A)} x {len(VALUES_B)} = {grid_size} 组参数")
+    search_df = adaptive_search()
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    search_file = os.path.join(OUTPUT_DIR, f'adaptive_search_{STRATEGY}.csv')
+    search_df.to_csv(search_file, index=False)
+    print(f"\n共计算 {len(search_df)} 组参数（完整网格的 {len(search_df) / grid_size:.1%}）")
+    print(f"所有计算过的参数已保存到: {search_file}")
+
+    best = search_df.loc[search_df[METRIC].idxmax()]
+    params = ['M', *PARAM_COLUMNS[STRATEGY]]
+    print(f"\n最佳参数组合(按{METRIC}):")
+    for p in params:
+        print(f"  {p} = {best[p]:g}")
+    print(f"  最终累计PNL = {best['final_cpnl']:.6f}")
+    print(f"  Sharpe Ratio = {best['sharpe_ratio']:.2f}")
@@ -0,0 +1,243 @@
+import glob
+import os
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from kline_cache import write_cache
+from merge_fundingRate_prices import _has_header
+from unzip_marketData import KLINE_COLUMNS
+
+# 把 aggTrades 日文件流式聚合成与 klineData.csv 相同列的K线
+# - 时间K线（1s / 1m / 1h ...）：按天并行处理，相邻两天的首尾K线属于同一根时合并
+# - 成交量 / 成交额K线：K线边界依赖之前所有成交的累计量，按时间顺序单进程流式处理
+INPUT_DIR = './marketData/aggTrades'
+OUTPUT_FILE = 'aggTrades_bars.csv'
+BAR_TYPE = 'time'        # 'time' / 'volume' / 'dollar'
+BAR_INTERVAL = '1m'      # 时间K线周期
+BAR_THRESHOLD = 100.0    # 成交量K线的成交量 / 成交额K线的成交额
+CHUNK_ROWS = 1000000
+WORKERS = None
+
+INTERVAL_MS = {'s': 1000, 'm': 60 * 1000, 'h': 60 * 60 * 1000, 'd': 24 * 60 * 60 * 1000}
+BAR_FIELDS = ['key', 'first_time', 'last_time', 'open', 'high', 'low', 'close', 'volume',
+              'quote_volume', 'count', 'taker_buy_volume', 'taker_buy_quote_volume']
+
+
+def parse_interval(interval):
+    return int(interval[:-1]) * INTERVAL_MS[interval[-1]]
+
+
+def iter_trade_chunks(zip_file, chunk_rows=CHUNK_ROWS):
+    """
+    分块读取一个 aggTrades zip：agg_trade_id, price, quantity, first_trade_id, last_trade_id, transact_time, is_buyer_maker
+    """
+    with zipfile.ZipFile(zip_file, 'r') as zip_ref:
+        for name in zip_ref.namelist():
+            if not name.endswith('.csv'):
+                continue
+            skip = 1 if _has_header(zip_ref, name) else 0
+            with zip_ref.open(name) as source:
+                reader = pd.read_csv(source, header=None, skiprows=skip, usecols=[1, 2, 3, 4, 5, 6], chunksize=chunk_rows)
+                for chunk in reader:
+                    times = chunk[5].to_numpy(dtype=np.int64)
+                    yield {
+                        'price': chunk[1].to_numpy(dtype=np.float64),
+                        'qty': chunk[2].to_numpy(dtype=np.float64),
+                        'trades': (chunk[4] - chunk[3] + 1).to_numpy(dtype=np.int64),
+                        # 新版现货数据的时间戳是微秒
+                        'time': np.where(times >= 10 ** 15, times // 1000, times),
+                        'buyer_maker': chunk[6].astype(str).str.lower().eq('true').to_numpy(),
+                    }
+
+
+def aggregate(keys, chunk):
+    """
+    把一块成交按 keys（单调不减）聚合成K线，返回每根K线的字段数组
+    """
+    starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+    ends = np.append(starts[1:], len(keys)) - 1
+    price, qty = chunk['price'], chunk['qty']
+    quote = price * qty
+    taker_buy = ~chunk['buyer_maker']
+    return {
+        'key': keys[starts],
+        'first_time': chunk['time'][starts],
+        'last_time': chunk['time'][ends],
+        'open': price[starts],
+        'high': np.maximum.reduceat(price, starts),
+        'low': np.minimum.reduceat(price, starts),
+        'close': price[ends],
+        'volume': np.add.reduceat(qty, starts),
+        'quote_volume': np.add.reduceat(quote, starts),
+        'count': np.add.reduceat(chunk['trades'], starts),
+        'taker_buy_volume': np.add.reduceat(np.where(taker_buy, qty, 0.0), starts),
+        'taker_buy_quote_volume': np.add.reduceat(np.where(taker_buy, quote, 0.0), starts),
+    }
+
+
+def _take(bars, sl):
+    return {k: v[sl] for k, v in bars.items()}
+
+
+def stitch(head, tail):
+    """
+    把 tail 接在 head 后面；head 最后一根与 tail 第一根属于同一根K线时合并
+    """
+    if head is None or len(head['key']) == 0:
+        return tail
+    if len(tail['key']) == 0:
+        return head
+    if head['key'][-1] != tail['key'][0]:
+        return {k: np.concatenate([head[k], tail[k]]) for k in BAR_FIELDS}
+    a, b = _take(head, slice(-1, None)), _take(tail, slice(0, 1))
+    merged = {
+        'key': a['key'],
+        'first_time': a['first_time'],
+        'last_time': b['last_time'],
+        'open': a['open'],
+        'high': np.maximum(a['high'], b['high']),
+        'low': np.minimum(a['low'], b['low']),
+        'close': b['close'],
+    }
+    for k in ['volume', 'quote_volume', 'count', 'taker_buy_volume', 'taker_buy_quote_volume']:
+        merged[k] = a[k] + b[k]
+    return {k: np.concatenate([head[k][:-1], merged[k], tail[k][1:]]) for k in BAR_FIELDS}
+
+
+def iter_bars(chunks, key_func):
+    """
+    流式聚合：每块只输出已经完整的K线，最后一根保留下来与下一块合并
+    """
+    carry = None
+    for chunk in chunks:
+        if len(chunk['time']) == 0:
+            continue
+        bars = stitch(carry, aggregate(key_func(chunk), chunk))
+        n = len(bars['key'])
+        if n > 1:
+            yield _take(bars, slice(0, n - 1))
+        carry = _take(bars, slice(n - 1, n))
+    if carry is not None:
+        yield carry
+
+
+def time_keys(interval_ms):
+    return lambda chunk: chunk['time'] // interval_ms
+
+
+def volume_keys(threshold, dollar=False):
+    """
+    成交量 / 成交额K线：成交之前的累计量 // threshold 作为K线编号，跨块保留累计量
+    """
+    state = {'offset': 0.0}
+
+    def keys(chunk):
+        amount = chunk['qty'] * chunk['price'] if dollar else chunk['qty']
+        # 以上一块的累计量作为起点做累加，与整段一次累加的结果逐位一致
+        cum = np.cumsum(np.concatenate([[state['offset']], amount]))
+        state['offset'] = cum[-1]
+        return np.floor(cum[:-1] / threshold).astype(np.int64)
+    return keys
+
+
+def to_kline_frame(bars, interval_ms=None):
+    """
+    转成 kline 列格式：时间K线的 open_time / close_time 为周期边界，其余K线为首笔 / 末笔成交时间
+    """
+    df = pd.DataFrame({
+        'open_time': bars['key'] * interval_ms if interval_ms else bars['first_time'],
+        'open': bars['open'],
+        'high': bars['high'],
+        'low': bars['low'],
+        'close': bars['close'],
+        'volume': bars['volume'],
+        'close_time': bars['key'] * interval_ms + interval_ms - 1 if interval_ms else bars['last_time'],
+        'quote_volume': bars['quote_volume'],
+        'count': bars['count'],
+        'taker_buy_volume': bars['taker_buy_volume'],
+        'taker_buy_quote_volume': bars['taker_buy_quote_volume'],
+        'ignore': 0,
+    })
+    return df[KLINE_COLUMNS]
+
+
+def _day_time_bars(args):
+    zip_file, interval_ms, chunk_rows = args
+    # iter_bars 输出的各段K线互不重叠（块边界的K线已经合并），最后一次拼接即可
+    parts = list(iter_bars(iter_trade_chunks(zip_file, chunk_rows), time_keys(interval_ms)))
+    if not parts:
+        return None
+    return {k: np.concatenate([p[k] for p in parts]) for k in BAR_FIELDS}
+
+
+def iter_time_bars(zip_files, interval_ms, workers=WORKERS, chunk_rows=CHUNK_ROWS):
+    """
+    按天并行生成时间K线，按日期顺序拼接，相邻两天的边界K线合并
+    最多同时提交 2 * workers 天的任务，取走一天再补交一天，内存中只有这几天的K线（与日期范围长短无关）
+    """
+    carry = None
+    workers = workers or os.cpu_count() or 1
+    tasks = iter([(f, interval_ms, chunk_rows) for f in zip_files])
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque(executor.submit(_day_time_bars, t) for _, t in zip(range(2 * workers), tasks))
+        while pending:
+            day = pending.popleft().result()
+            task = next(tasks, None)
+            if task is not None:
+                pending.append(executor.submit(_day_time_bars, task))
+            if day is None:
+                continue
+            bars = stitch(carry, day)
+            n = len(bars['key'])
+            if n > 1:
+                yield to_kline_frame(_take(bars, slice(0, n - 1)), interval_ms)
+            carry = _take(bars, slice(n - 1, n))
+    if carry is not None:
+        yield to_kline_frame(carry, interval_ms)
+
+
+def iter_volume_bars(zip_files, threshold, dollar=False, chunk_rows=CHUNK_ROWS):
+    chunks = (chunk for f in zip_files for chunk in iter_trade_chunks(f, chunk_rows))
+    for bars in iter_bars(chunks, volume_keys(threshold, dollar)):
+        yield to_kline_frame(bars)
+
+
+def build_bars(input_dir=INPUT_DIR, output_file=OUTPUT_FILE, bar_type=BAR_TYPE, interval=BAR_INTERVAL,
+               threshold=BAR_THRESHOLD, output_format='csv', workers=WORKERS, chunk_rows=CHUNK_ROWS):
+    """
+    把 input_dir 下的 aggTrades zip（文件名按日期排序）聚合成K线
+    - output_format='csv'：写 output_file
+    - output_format='cache'：写列式二进制缓存 output_file + '.cache'（见 kline_cache），不写CSV；
+      使用方式同 unzip_marketData.merge_csv_files：传不带 .cache 的 output_file
+    """
+    zip_files = sorted(glob.glob(os.path.join(input_dir, '*.zip')))
+    if not zip_files:
+        print("没有找到任何aggTrades数据")
+        return 0
+    if bar_type == 'time':
+        frames = iter_time_bars(zip_files, parse_interval(interval), workers, chunk_rows)
+    elif bar_type in ('volume', 'dollar'):
+        frames = iter_volume_bars(zip_files, threshold, bar_type == 'dollar', chunk_rows)
+    else:
+        raise ValueError(f'unknown bar_type: {bar_type}')
+
+    if output_format == 'cache':
+        path = output_file + '.cache'
+        count = write_cache(frames, path)['rows']
+    else:
+        path = output_file
+        count = 0
+        tmp = output_file + '.part'
+        with open(tmp, 'w', newline='', encoding='utf-8') as f:
+            for frame in frames:
+                frame.to_csv(f, index=False, header=(count == 0))
+                count += len(frame)
+        os.replace(tmp, output_file)
+    print(f"生成 {count} 根K线（{len(zip_files)} 个文件），输出：{path}")
+    return count
+
+
+if __name__ == "__main__":
+    build_bars()
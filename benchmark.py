@@ -0,0 +1,334 @@
+import contextlib
+import datetime
+import functools
+import gc
+import http.server
+import io
+import json
+import os
+import platform
+import shutil
+import threading
+import time
+import tracemalloc
+import zipfile
+import numpy as np
+import pandas as pd
+import download_binance_marketData as dl
+import funding_arbitrage_strategy as funding
+import moving_average_strategy_V1 as strategy_v1
+import moving_average_strategy_V2 as strategy_v2
+from kline_cache import ensure_cache, load_columns
+from parallel_sweep import run_sweep
+from position_engine import hysteresis_positions
+from sweep_engine import rolling_zscore
+from unzip_marketData import KLINE_COLUMNS, merge_csv_files
+
+# 回测和数据处理热点路径的基准测试，不需要联网：
+# 输入为 klineData.csv 以及按同样格式生成的 1M / 10M 根合成K线，下载用本地 HTTP 服务代替
+# 每项记录墙钟时间（REPEAT 次取最小）和 tracemalloc 统计的峰值内存（memmap 映射的页不计入），
+# 结果写入 RESULTS_FILE（json），指定 BASELINE_FILE 时与之前的结果对比
+CSV_FILE = 'klineData.csv'
+BENCH_DIR = 'bench_data'          # 合成数据和临时输出目录（生成一次后复用）
+SIZES = {'klineData': None, '1M': 1000000, '10M': 10000000}
+GRID_SIZES = ['klineData']        # 只在这些数据上跑完整参数网格
+REPEAT = 3
+DAY_ROWS = 1440                   # 合成每日 zip 的行数（1m K线）
+MERGE_MAX_DAYS = 2000             # unzip/merge 最多使用的每日 zip 数
+DOWNLOAD_FILES = 200              # 本地下载基准的文件数
+RESULTS_FILE = os.path.join(BENCH_DIR, 'bench_results.json')
+BASELINE_FILE = None
+REGRESSION_THRESHOLD = 0.10       # 比基准慢 10% 以上标记为变慢
+
+V1_GRID = ([4, 8, 12, 16, 20, 24, 28, 32, 36, 40, 44, 48, 52, 56, 60, 64, 68, 72, 76, 80, 84, 88, 92, 96, 100, 104, 108, 112, 116, 120],
+           [4, 8, 12, 16, 20, 24, 28, 32, 36, 40, 44, 48, 52, 56, 60, 64, 68, 72, 76, 80, 84, 88, 92, 96, 100, 104, 108, 112, 116, 120],
+           [1.2, 1.4, 1.6, 1.8, 2.0])
+V2_GRID = ([4, 8, 12, 16, 20, 24, 28, 32, 36, 40, 44, 48, 52, 56, 60, 64, 68, 72, 76, 80, 84, 88, 92, 96, 100, 104, 108, 112, 116, 120],
+           [0.6, 0.7, 0.8, 0.9, 1.0, 1.1, 1.2, 1.3, 1.4, 1.5],
+           [0.1, 0.2, 0.3, 0.4, 0.5])
+
+
+def synthetic_klines(n_bars, seed=0, start_ms=1577836800000, interval_ms=60 * 1000):
+    """
+    生成与 klineData.csv 同列的合成K线（对数收益为正态随机游走）
+    """
+    rng = np.random.default_rng(seed)
+    close = 30000.0 * np.exp(np.cumsum(rng.normal(0, 0.002, n_bars)))
+    open_ = np.concatenate([[30000.0], close[:-1]])
+    spread = np.abs(rng.normal(0, 0.001, n_bars)) * close
+    volume = rng.gamma(2.0, 50.0, n_bars)
+    open_time = start_ms + np.arange(n_bars, dtype=np.int64) * interval_ms
+    return pd.DataFrame({
+        'open_time': open_time,
+        'open': open_.round(1),
+        'high': (np.maximum(open_, close) + spread).round(1),
+        'low': (np.minimum(open_, close) - spread).round(1),
+        'close': close.round(1),
+        'volume': volume.round(3),
+        'close_time': open_time + interval_ms - 1,
+        'quote_volume': (volume * close).round(5),
+        'count': rng.integers(1000, 100000, n_bars),
+        'taker_buy_volume': (volume / 2).round(3),
+        'taker_buy_quote_volume': (volume * close / 2).round(5),
+        'ignore': 0,
+    })[KLINE_COLUMNS]
+
+
+def synthetic_csv(n_bars, bench_dir=BENCH_DIR, chunk_rows=1000000):
+    """
+    生成（或复用）n_bars 根合成K线的 CSV，分块写出
+    """
+    path = os.path.join(bench_dir, f'synthetic_{n_bars}.csv')
+    if os.path.exists(path):
+        return path
+    os.makedirs(bench_dir, exist_ok=True)
+    tmp = path + '.part'
+    with open(tmp, 'w', newline='', encoding='utf-8') as f:
+        for k, start in enumerate(range(0, n_bars, chunk_rows)):
+            rows = min(chunk_rows, n_bars - start)
+            df = synthetic_klines(rows, seed=k, start_ms=1577836800000 + start * 60 * 1000)
+            df.to_csv(f, index=False, header=(k == 0))
+    os.replace(tmp, path)
+    return path
+
+
+def synthetic_funding_csv(n_rows, path, seed=0):
+    """
+    生成 funding_arbitrage_strategy 的输入 fundingRate_with_prices.csv
+    """
+    rng = np.random.default_rng(seed)
+    futures = 30000.0 * np.exp(np.cumsum(rng.normal(0, 0.01, n_rows)))
+    pd.DataFrame({
+        'symbol': 'BTCUSDT',
+        'fundingTime': 1577836800000 + np.arange(n_rows, dtype=np.int64) * 8 * 60 * 60 * 1000,
+        'fundingRate': rng.normal(0.0001, 0.0002, n_rows).round(8),
+        'markPrice': futures.round(2),
+        'spotPrice': (futures * (1 - rng.normal(0.0005, 0.0005, n_rows))).round(2),
+        'futuresPrice': futures.round(2),
+    }).to_csv(path, index=False)
+
+
+def daily_zips(csv_file, out_dir, day_rows=DAY_ROWS, max_days=MERGE_MAX_DAYS):
+    """
+    把 CSV 切成每日 zip（与 Binance 每日K线文件格式相同，无表头），返回 zip 文件列表
+    """
+    if os.path.isdir(out_dir):
+        return sorted(os.path.join(out_dir, f) for f in os.listdir(out_dir) if f.endswith('.zip'))
+    tmp_dir = out_dir + '.part'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    reader = pd.read_csv(csv_file, chunksize=day_rows, nrows=day_rows * max_days)
+    for day, chunk in enumerate(reader):
+        name = f'BENCH-1m-{day:06d}'
+        with zipfile.ZipFile(os.path.join(tmp_dir, name + '.zip'), 'w', zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr(name + '.csv', chunk.to_csv(index=False, header=False))
+    os.replace(tmp_dir, out_dir)
+    return daily_zips(csv_file, out_dir)
+
+
+@contextlib.contextmanager
+def local_http_server(directory):
+    """
+    在本地随机端口上提供 directory 下的静态文件，产出根 URL
+    """
+    handler = functools.partial(_QuietHandler, directory=directory)
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f'http://127.0.0.1:{server.server_address[1]}/'
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextlib.contextmanager
+def working_dir(path):
+    cwd = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(cwd)
+
+
+def measure(func, repeat=REPEAT, memory=True):
+    """
+    运行 func repeat 次取最短墙钟时间（秒），再在 tracemalloc 下单独运行一次得到峰值内存（MB）
+    （tracemalloc 本身会明显拖慢运行，所以计时不开启）；func 的输出被丢弃
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            func()
+        best = min(best, time.perf_counter() - start)
+    peak = None
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                func()
+            peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        finally:
+            tracemalloc.stop()
+    return {'seconds': best, 'peak_mb': peak}
+
+
+def kline_cases(csv_file, size, grids):
+    """
+    K线相关的基准项：(名称, 函数, 附加信息)
+    """
+    ensure_cache(csv_file)
+    close = np.asarray(load_columns(csv_file, ['close'])['close'])
+    zscore = rolling_zscore(close, 20)
+    cases = [
+        ('csv_load', lambda: pd.read_csv(csv_file), {}),
+        ('cache_load', lambda: np.array(load_columns(csv_file, ['close'])['close']), {}),
+        ('features', lambda: rolling_zscore(close, 20), {}),
+        ('v2_positions', lambda: hysteresis_positions(zscore, 20, 1.0, 0.3), {}),
+        ('v1_combo', lambda: strategy_v1.moving_average_strategy(csv_file, 20, 32, 1.2, write_artifacts=False), {}),
+        ('v2_combo', lambda: strategy_v2.moving_average_strategy(csv_file, 20, 1.0, 0.3, write_artifacts=False), {}),
+    ]
+    if size in grids:
+        for name, strategy, grid in [('v1_grid', 'V1', V1_GRID), ('v2_grid', 'V2', V2_GRID)]:
+            combos = len(grid[0]) * len(grid[1]) * len(grid[2])
+            cases.append((name, functools.partial(run_sweep, csv_file, strategy, *grid), {'combos': combos}))
+    return cases, len(close)
+
+
+def funding_case(n_rows, bench_dir=BENCH_DIR):
+    work_dir = os.path.join(bench_dir, f'funding_{n_rows}')
+    os.makedirs(work_dir, exist_ok=True)
+    if not os.path.exists(os.path.join(work_dir, funding.INPUT_FILE)):
+        synthetic_funding_csv(n_rows, os.path.join(work_dir, funding.INPUT_FILE))
+
+    def run():
+        with working_dir(work_dir):
+            funding.funding_arbitrage_strategy()
+    return run
+
+
+def merge_case(zip_files, bench_dir=BENCH_DIR):
+    out_file = os.path.join(bench_dir, 'merged_bench.csv')
+    input_dir = os.path.dirname(zip_files[0])
+    return lambda: merge_csv_files(input_dir, out_file)
+
+
+def download_case(zip_files, root_url, bench_dir=BENCH_DIR):
+    dest = os.path.join(bench_dir, 'downloaded')
+    input_dir = os.path.dirname(zip_files[0])
+    planned = [(None, root_url + os.path.basename(input_dir) + '/' + os.path.basename(f), os.path.basename(f))
+               for f in zip_files]
+
+    def run():
+        shutil.rmtree(dest, ignore_errors=True)
+        os.makedirs(dest)
+        statuses = dl.download_all(planned, dest, retries=0)
+        failed = [fname for fname, status in statuses if status != 'downloaded']
+        if failed:
+            raise RuntimeError(f'{len(failed)} downloads failed')
+    return run
+
+
+def run_benchmarks(csv_file=CSV_FILE, sizes=SIZES, grids=GRID_SIZES, repeat=REPEAT, bench_dir=BENCH_DIR):
+    results = []
+
+    def record(name, size, func, bars, extra=None, n=repeat, memory=True):
+        result = {'name': name, 'size': size, 'bars': bars}
+        result.update(measure(func, n, memory))
+        result.update(extra or {})
+        results.append(result)
+        peak = f"{result['peak_mb']:>10.1f} MB" if result['peak_mb'] is not None else ''
+        print(f"  {name:<16} {size:<10} {result['seconds']:>10.4f}s  {peak}")
+
+    os.makedirs(bench_dir, exist_ok=True)
+    for size, n_bars in sizes.items():
+        path = csv_file if n_bars is None else synthetic_csv(n_bars, bench_dir)
+        print(f"{size}: {path}")
+        cases, bars = kline_cases(path, size, grids)
+        for name, func, extra in cases:
+            # 完整参数网格只跑一次；网格在 worker 进程中计算，tracemalloc 统计不到，不记录内存
+            grid = name.endswith('_grid')
+            record(name, size, func, bars, extra, 1 if grid else repeat, not grid)
+        record('funding_strategy', size, funding_case(bars, bench_dir), bars)
+
+    # unzip/merge 和下载使用最大一份合成数据切出的每日 zip
+    largest = max((n for n in sizes.values() if n), default=None)
+    source = synthetic_csv(largest, bench_dir) if largest else csv_file
+    name = os.path.splitext(os.path.basename(source))[0]
+    zip_files = daily_zips(source, os.path.join(bench_dir, f'daily_zips_{name}_{MERGE_MAX_DAYS}'), DAY_ROWS, MERGE_MAX_DAYS)
+    bars = len(zip_files) * DAY_ROWS
+    print(f"daily zips: {len(zip_files)} files")
+    record('unzip_merge', f'{len(zip_files)}d', merge_case(zip_files, bench_dir), bars, n=1)
+    files = zip_files[:DOWNLOAD_FILES]
+    total_mb = sum(os.path.getsize(f) for f in files) / 2 ** 20
+    with local_http_server(bench_dir) as root_url:
+        record('download', f'{len(files)}f', download_case(files, root_url, bench_dir), len(files) * DAY_ROWS,
+               {'files': len(files), 'mb': total_mb})
+    results[-1]['mb_per_second'] = total_mb / results[-1]['seconds']
+    return results
+
+
+def environment():
+    return {
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def save_results(results, path=RESULTS_FILE):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'environment': environment(), 'results': results}, f, indent=2)
+
+
+def load_results(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)['results']
+
+
+def compare_results(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """
+    按 (name, size) 与基准对比，返回 DataFrame：时间 / 内存比值（当前 / 基准）和是否变慢
+    """
+    base = {(r['name'], r['size']): r for r in baseline}
+    rows = []
+    for r in results:
+        b = base.get((r['name'], r['size']))
+        if b is None:
+            continue
+        time_ratio = r['seconds'] / b['seconds'] if b['seconds'] > 0 else float('inf')
+        rows.append({
+            'name': r['name'],
+            'size': r['size'],
+            'baseline_s': b['seconds'],
+            'current_s': r['seconds'],
+            'time_ratio': time_ratio,
+            'memory_ratio': r['peak_mb'] / b['peak_mb'] if r['peak_mb'] and b['peak_mb'] else None,
+            'status': 'slower' if time_ratio > 1 + threshold else ('faster' if time_ratio < 1 - threshold else 'same'),
+        })
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    results = run_benchmarks()
+    save_results(results)
+    print(f"\n结果已保存到: {RESULTS_FILE}")
+    if BASELINE_FILE:
+        comparison = compare_results(results, load_results(BASELINE_FILE))
+        print(f"\n与基准 {BASELINE_FILE} 对比:")
+        print(comparison.to_string(index=False))
@@ -0,0 +1,144 @@
+import math
+import os
+import numpy as np
+import pandas as pd
+import instrument
+from kline_cache import load_columns
+from position_engine import open_signals, hysteresis_positions, position_pnl
+from sweep_engine import settle_zscore, v1_positions
+
+# 分块（out-of-core）回测：按 BLOCK_ROWS 行一块处理 memmap 缓存中的K线，内存占用与数据长度无关
+# 块之间只传递需要的状态：最近 M-1 个 close（rolling 窗口）、V1 最近 N-1 个开仓信号、V2 当前持仓、
+# 上一根K线的 close / position、累计 pnl，以及 Sharpe / hp 用的累计量
+# 与一次性在内存中计算的 moving_average_strategy 相比：
+# - ma / close_zscore 由每块前接 M-1 个 close 后重新做 pandas rolling 得到（O(块长)），pandas 的滚动累加从每块开头
+#   重新开始，与整段计算只在浮点误差内一致：200 万根1分钟随机游走、每块 10 万行时，M=20 / 240 的 z_score 最大相差
+#   约 4e-7 / 2e-7；M 很小（如 2）时整段计算本身的累加误差就很大，两者可相差 0.7
+# - z_score 不落在阈值附近时开仓信号、position、return、pnl、cpnl、total_signals、max_position、final_cpnl 完全相同；
+#   误差改变了与 z_open / z_close 的比较结果时，信号和之后的持仓才会不同
+# - sharpe_ratio / hp 由各块的累计量合并得到，在浮点误差内一致
+CSV_FILE = 'klineData.csv'
+STRATEGY = 'V2'
+PARAMS = {'M': 20, 'z_open': 1.0, 'z_close': 0.3}    # V1: {'M': .., 'N': .., 'z_open': ..}
+BLOCK_ROWS = 1000000
+OUTPUT_DIR = 'kline'
+
+
+def _merge_moments(state, values):
+    # Chan 等的并行合并：(count, mean, m2) 与一块数据的矩合并，用于分块计算样本标准差
+    n_b = len(values)
+    if n_b == 0:
+        return state
+    n_a, mean_a, m2_a = state
+    mean_b = values.sum() / n_b
+    m2_b = ((values - mean_b) ** 2).sum()
+    n = n_a + n_b
+    delta = mean_b - mean_a
+    return n, mean_a + delta * n_b / n, m2_a + m2_b + delta * delta * n_a * n_b / n
+
+
+def chunked_backtest(csv_file, strategy, M, a, b, block_rows=BLOCK_ROWS, output_file=None):
+    """
+    分块运行一组参数（V1: a=N, b=z_open；V2: a=z_open, b=z_close），返回与参数遍历格式相同的汇总行
+    output_file 不为空时逐块追加写出与 moving_average_strategy 相同列的明细CSV
+    """
+    if strategy not in ('V1', 'V2'):
+        raise ValueError(f'unknown strategy: {strategy}')
+    columns = load_columns(csv_file)
+    n = len(columns['close'])
+    instrument.count('rows', n)
+    z_open = b if strategy == 'V1' else a
+
+    close_tail = np.empty(0, dtype=np.float64)      # 最近 M-1 个 close
+    signal_tail = np.empty(0, dtype=np.int64)       # V1：最近 N-1 个开仓信号
+    last_close = last_position = None
+    cpnl = 0.0
+    moments = (0, 0.0, 0.0)
+    sum_gmv = sum_turnover = 0.0
+    total_signals = 0
+    max_position = 0
+
+    if output_file:
+        os.makedirs(os.path.dirname(output_file) or '.', exist_ok=True)
+    for start in range(0, n, block_rows):
+        end = min(start + block_rows, n)
+        close = np.asarray(columns['close'][start:end], dtype=np.float64)
+
+        with instrument.stage('zscore'):
+            ext = pd.Series(np.concatenate([close_tail, close]), copy=False)
+            rolling_mean = ext.rolling(window=M).mean()
+            rolling_std = ext.rolling(window=M).std()
+            ma = rolling_mean.to_numpy()[len(close_tail):]
+            zscore = settle_zscore(((ext - rolling_mean) / rolling_std).to_numpy(), ext.to_numpy(), M)[len(close_tail):]
+            close_tail = ext.to_numpy()[-(M - 1):] if M > 1 else close_tail
+
+        with instrument.stage('positions'):
+            # 全局前 M 个信号为 0，块内只需要把仍在前 M 根之内的部分置 0
+            skip = max(M - start, 0)
+            signal = open_signals(zscore, skip, z_open)[0]
+            if strategy == 'V1':
+                ext_signal = np.concatenate([signal_tail, signal])
+                position = v1_positions(ext_signal, [a])[0][len(signal_tail):]
+                signal_tail = ext_signal[-(a - 1):] if a > 1 else signal_tail[:0]
+            else:
+                position = hysteresis_positions(zscore, skip, a, b, initial=last_position or 0)[0]
+
+        with instrument.stage('pnl'):
+            # 前接上一根K线的 close / position，块内第一行的 return / pnl / turnover 与整段计算相同
+            if last_close is None:
+                values = position_pnl(close, position)
+            else:
+                values = position_pnl(np.concatenate([[last_close], close]),
+                                      np.concatenate([[last_position], position]))
+                values = {k: v[1:] for k, v in values.items()}
+            values['cpnl'] = np.cumsum(np.concatenate([[cpnl], values['pnl']]))[1:]
+
+        cpnl = values['cpnl'][-1]
+        last_close, last_position = close[-1], position[-1]
+        moments = _merge_moments(moments, values['pnl'])
+        sum_gmv += np.abs(values['gmv']).sum()
+        sum_turnover += values['turnover'].sum()
+        total_signals += int((signal != 0).sum())
+        max_position = max(max_position, np.abs(position).max())
+
+        if output_file:
+            df = pd.DataFrame({c: np.asarray(v[start:end]) for c, v in columns.items()})
+            df['ma'] = ma
+            df['close_zscore'] = zscore
+            if strategy == 'V1':
+                df['signal'] = signal
+                df['open_signal'] = signal
+                df['position'] = position
+                extra = ['return', 'pnl', 'cpnl']
+            else:
+                df['open_signal'] = signal
+                df['position'] = position
+                extra = ['gmv', 'turnover', 'return', 'pnl', 'cpnl']
+            for col in extra:
+                df[col] = values[col]
+            with instrument.stage('to_csv'):
+                df.to_csv(output_file, mode='w' if start == 0 else 'a', header=start == 0, index=False)
+
+    count, pnl_mean, m2 = moments
+    pnl_std = math.sqrt(m2 / (count - 1)) if count > 1 else float('nan')
+    sharpe_ratio = (pnl_mean / pnl_std * 94) if pnl_std != 0 else 0
+    if strategy == 'V1':
+        return {'M': M, 'N': a, 'z_open': b, 'final_cpnl': cpnl, 'sharpe_ratio': sharpe_ratio,
+                'total_signals': total_signals, 'max_position': max_position}
+    hp = (sum_gmv / sum_turnover * 2) if sum_turnover != 0 else 0
+    return {'M': M, 'z_open': a, 'z_close': b, 'final_cpnl': cpnl, 'sharpe_ratio': sharpe_ratio, 'hp': hp,
+            'total_signals': total_signals, 'max_position': max_position}
+
+
+if __name__ == "__main__":
+    if STRATEGY == 'V1':
+        a, b = PARAMS['N'], PARAMS['z_open']
+        output_file = os.path.join(OUTPUT_DIR, f"merged_data_with_strategy_M{PARAMS['M']}_N{a}_z{b}.csv")
+    else:
+        a, b = PARAMS['z_open'], PARAMS['z_close']
+        output_file = os.path.join(OUTPUT_DIR, f"merged_data_with_strategy_M{PARAMS['M']}_z_open{a}_z_close{b}.csv")
+    print(f"分块回测: {STRATEGY} {PARAMS}，每块 {BLOCK_ROWS} 行")
+    row = chunked_backtest(CSV_FILE, STRATEGY, PARAMS['M'], a, b, output_file=output_file)
+    for key, value in row.items():
+        print(f"  {key} = {value}")
+    print(f"明细已保存到: {output_file}")
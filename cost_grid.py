@@ -0,0 +1,82 @@
+import os
+import pandas as pd
+from parallel_sweep import run_sweep
+from render import PlotRenderer, heatmap_panel, render_heatmaps
+
+# 成本网格：参数遍历时只计算一次 gross pnl / 换手 / 持仓的矩，所有成本水平的净值指标一次广播得到
+# （见 sweep_engine.cost_moments / net_cost_metrics），不需要为每个成本水平重跑回测
+CSV_FILE = 'klineData.csv'
+STRATEGY = 'V2'
+M_VALUES = [4, 8, 12, 16, 20, 24, 28, 32, 36, 40, 44, 48, 52, 56, 60]
+VALUES_A = [0.6, 0.7, 0.8, 0.9, 1.0, 1.1, 1.2, 1.3, 1.4, 1.5]   # V1: N_values；V2: z_open_values
+VALUES_B = [0.1, 0.2, 0.3, 0.4, 0.5]                            # V1: z_open_values；V2: z_close_values
+# 每边手续费 / 滑点（bps），funding_bps 为每 8 小时资金费率（bps，永续合约，可省略）
+COST_LEVELS = [
+    {'fee_bps': 0, 'slippage_bps': 0},
+    {'fee_bps': 2, 'slippage_bps': 1},
+    {'fee_bps': 4, 'slippage_bps': 2},
+    {'fee_bps': 4, 'slippage_bps': 2, 'funding_bps': 1},
+]
+# K线周期（毫秒），用于把每 8 小时的资金费率折算到每根K线；None 时由数据的 open_time 推断
+BAR_MS = None
+OUTPUT_DIR = 'kline'
+
+COST_COLUMNS = ['fee_bps', 'slippage_bps', 'funding_bps']
+
+
+def cost_label(fee_bps, slippage_bps, funding_bps):
+    return f'fee{fee_bps:g}_slip{slippage_bps:g}_funding{funding_bps:g}'
+
+
+def plot_cost_heatmaps(summary_df, strategy, output_dir=OUTPUT_DIR, value='net_sharpe_ratio', renderer=None):
+    """
+    每个成本水平一张图，每个 M 一个子图，画 value 的热力图，返回生成的文件列表
+    renderer 不为空时交给渲染进程生成（见 render.PlotRenderer），返回提交的文件列表，renderer.close() 后才写完
+    """
+    index, columns = ('z_open', 'N') if strategy == 'V1' else ('z_close', 'z_open')
+    files = []
+    for level, level_df in summary_df.groupby(COST_COLUMNS, sort=False):
+        panels = []
+        for M in sorted(level_df['M'].unique()):
+            heatmap_data = level_df[level_df['M'] == M].pivot(index=index, columns=columns, values=value)
+            panels.append(heatmap_panel(heatmap_data, f'M={M}', columns, index))
+        label = cost_label(*level)
+        heatmap_file = os.path.join(output_dir, f'{value}_heatmap_{strategy}_{label}.png')
+        kwargs = {'suptitle': f'{strategy} {value} ({label})', 'cbar_label': value}
+        if renderer is not None:
+            renderer.heatmaps(heatmap_file, panels, **kwargs)
+        else:
+            render_heatmaps(heatmap_file, panels, **kwargs)
+        files.append(heatmap_file)
+    return files
+
+
+def cost_summary(summary_df, strategy):
+    """
+    每个成本水平下按净 Sharpe 最好的参数组合
+    """
+    params = ['M', 'N', 'z_open'] if strategy == 'V1' else ['M', 'z_open', 'z_close']
+    best = summary_df.loc[summary_df.groupby(COST_COLUMNS, sort=False)['net_sharpe_ratio'].idxmax()]
+    return best[COST_COLUMNS + params + ['final_cpnl', 'net_final_cpnl', 'cost', 'sharpe_ratio', 'net_sharpe_ratio']]
+
+
+if __name__ == "__main__":
+    n_combos = len(M_VALUES) * len(VALUES_A) * len(VALUES_B)
+    print(f"开始成本网格遍历: {n_combos} 组参数 x {len(COST_LEVELS)} 个成本水平")
+    results_summary = run_sweep(CSV_FILE, STRATEGY, M_VALUES, VALUES_A, VALUES_B, cost_levels=COST_LEVELS,
+                                bar_ms=BAR_MS)
+    summary_df = pd.DataFrame(results_summary)
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    summary_file = os.path.join(OUTPUT_DIR, f'strategy_summary_costs_{STRATEGY}.csv')
+    summary_df.to_csv(summary_file, index=False)
+    print(f"汇总结果已保存到: {summary_file}")
+
+    print("\n各成本水平下的最佳参数（按净 Sharpe）:")
+    print(cost_summary(summary_df, STRATEGY).to_string(index=False))
+
+    # 每个成本水平的热力图交给渲染进程并行生成
+    renderer = PlotRenderer()
+    plot_cost_heatmaps(summary_df, STRATEGY, renderer=renderer)
+    for heatmap_file in renderer.close():
+        print(f"热力图已保存到: {heatmap_file}")
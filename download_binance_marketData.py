@@ -1,10 +1,12 @@
 import datetime
+import http.client
 import os
+import random
 import sys
+import threading
 import time
-from urllib.parse import urljoin
-import urllib.request
-import urllib.error
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urljoin, urlsplit
 
 BASE_ROOT = 'https://data.binance.vision/'
 PREFIX = 'data/{market}/{interval}/{datatype}/{symbol}/'
@@ -21,6 +23,8 @@ MARKET_PARAM = 'futures/um'
 INTERVAL_PARAM = 'daily'
 DATATYPE_PARAM = 'klines'
 KLINE_INTERVAL = '1h'
+CONCURRENCY_PARAM = 8   # 下载线程数
+PER_HOST_LIMIT = 8      # 每个主机同时进行的请求数上限
 
 def parse_yyyymmdd(s):
     try:
@@ -36,7 +40,7 @@ def daterange(start_date, end_date):
         d += datetime.timedelta(days=1)
 
 
-def build_url(symbol, date_obj):
+def build_url(symbol, date_obj, base_root=None):
     date_str = date_obj.strftime('%Y-%m-%d')
     market = MARKET_PARAM
     interval = INTERVAL_PARAM
@@ -52,47 +56,118 @@ def build_url(symbol, date_obj):
         fname = FNAME_PATTERN.format(symbol=symbol, datatype=datatype, date=date_str)
     
     path = prefix + fname
-    return urljoin(BASE_ROOT, path), fname
-
-
-def url_exists(url, timeout=15):
-    req = urllib.request.Request(url, headers=HEADERS, method='HEAD')
-    try:
-        with urllib.request.urlopen(req, timeout=timeout) as resp:
-            return resp.status < 400
-    except urllib.error.HTTPError as he:
-        if he.code == 404:
-            return False
-        return False
-    except Exception:
-        return False
-
-
-def download(url, dest_path, overwrite=True, retries=2, timeout=120):
-    if os.path.exists(dest_path) and not overwrite:
-        return 'skipped'
-    tmp = dest_path + '.part'
+    return urljoin(base_root or BASE_ROOT, path), fname
+
+
+class ConnectionPool:
+    """
+    HTTP keep-alive 连接池：每个线程对每个主机复用一个连接，并限制每个主机的并发请求数
+    """
+
+    def __init__(self, per_host=PER_HOST_LIMIT, timeout=120):
+        self.per_host = per_host
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._limits = {}
+
+    def limit(self, url):
+        netloc = urlsplit(url).netloc
+        with self._lock:
+            if netloc not in self._limits:
+                self._limits[netloc] = threading.BoundedSemaphore(self.per_host)
+            return self._limits[netloc]
+
+    def connection(self, url):
+        parts = urlsplit(url)
+        conns = self._local.__dict__.setdefault('conns', {})
+        key = (parts.scheme, parts.netloc)
+        if key not in conns:
+            cls = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+            conns[key] = cls(parts.netloc, timeout=self.timeout)
+        return conns[key]
+
+    def reset(self, url):
+        parts = urlsplit(url)
+        conn = self._local.__dict__.get('conns', {}).pop((parts.scheme, parts.netloc), None)
+        if conn is not None:
+            conn.close()
+
+
+def fetch(pool, url, dest_path, retries=3, backoff=1.0, max_redirects=3):
+    """
+    用连接池中的 keep-alive 连接下载一个文件（不再单独发 HEAD 请求）
+    - GET 返回 404：'missing'
+    - 网络错误 / 429 / 5xx：指数退避后重试，重试用尽返回 'failed'
+    - 其他 4xx：直接 'failed'
+    """
     attempt = 0
-    while attempt <= retries:
+    redirects = 0
+    while True:
+        parts = urlsplit(url)
+        path = parts.path + ('?' + parts.query if parts.query else '')
         try:
-            req = urllib.request.Request(url, headers=HEADERS)
-            with urllib.request.urlopen(req, timeout=timeout) as resp, open(tmp, 'wb') as out:
-                while True:
-                    chunk = resp.read(1 << 20)
-                    if not chunk:
-                        break
-                    out.write(chunk)
-            os.replace(tmp, dest_path)
-            return 'downloaded'
-        except urllib.error.HTTPError as he:
-            if he.code == 404:
-                return 'missing'
-            attempt += 1
-            time.sleep(1 + attempt)
-        except Exception as e:
+            with pool.limit(url):
+                conn = pool.connection(url)
+                conn.request('GET', path, headers=HEADERS)
+                resp = conn.getresponse()
+                if resp.status == 200:
+                    tmp = dest_path + '.part'
+                    with open(tmp, 'wb') as out:
+                        while True:
+                            chunk = resp.read(1 << 20)
+                            if not chunk:
+                                break
+                            out.write(chunk)
+                    os.replace(tmp, dest_path)
+                    if resp.will_close:
+                        pool.reset(url)
+                    return 'downloaded'
+                # 读完响应体，连接才能继续复用
+                resp.read()
+                if resp.will_close:
+                    pool.reset(url)
+                if resp.status == 404:
+                    return 'missing'
+                if resp.status in (301, 302, 303, 307, 308) and redirects < max_redirects:
+                    redirects += 1
+                    url = urljoin(url, resp.getheader('Location'))
+                    continue
+                if resp.status != 429 and resp.status < 500:
+                    return 'failed'
+                raise http.client.HTTPException(f'HTTP {resp.status}')
+        except (OSError, http.client.HTTPException):
+            pool.reset(url)
             attempt += 1
-            time.sleep(1 + attempt)
-    return 'failed'
+            if attempt > retries:
+                return 'failed'
+            time.sleep(backoff * 2 ** (attempt - 1) + random.uniform(0, backoff))
+
+
+def download_all(planned, dest, workers=CONCURRENCY_PARAM, per_host=PER_HOST_LIMIT, overwrite=True,
+                 retries=3, backoff=1.0, timeout=120):
+    """
+    并发下载 planned 中的 (date, url, fname)，返回与 planned 顺序一致的 (fname, status) 列表
+    """
+    pool = ConnectionPool(per_host=per_host, timeout=timeout)
+
+    def task(url, fname):
+        dest_path = os.path.join(dest, fname)
+        if os.path.exists(dest_path) and not overwrite:
+            return 'skipped'
+        return fetch(pool, url, dest_path, retries=retries, backoff=backoff)
+
+    statuses = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(task, url, fname): fname for d, url, fname in planned}
+        for future in as_completed(futures):
+            fname = futures[future]
+            try:
+                statuses[fname] = future.result()
+            except Exception:
+                statuses[fname] = 'failed'
+            print(statuses[fname] + ':', fname)
+    return [(fname, statuses[fname]) for d, url, fname in planned]
 
 
 def main():
@@ -145,14 +220,11 @@ def main():
         print('  ', fname, '-', url)
 
     print('\nStarting downloads into', dest)
-    for d, url, fname in planned:
-        dest_path = os.path.join(dest, fname)
-        exists = url_exists(url)
-        if not exists:
-            print('missing:', fname)
-            continue
-        status = download(url, dest_path)
-        print(status + ':', fname)
+    results = download_all(planned, dest)
+    counts = {}
+    for fname, status in results:
+        counts[status] = counts.get(status, 0) + 1
+    print('Summary:', ', '.join(f'{k}={v}' for k, v in sorted(counts.items())))
 
     print('All done.')
 
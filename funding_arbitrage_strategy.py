@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 
 # 配置参数
@@ -5,66 +6,86 @@ THRESHOLD = 0.0001  # 资费阈值
 INPUT_FILE = 'fundingRate_with_prices.csv'
 OUTPUT_FILE = 'fundingRate_with_strategy.csv'
 
-def funding_arbitrage_strategy():
+def funding_position_matrix(funding_rate, thresholds, close_thresholds=0.0):
+    """
+    一次计算多组阈值的期货仓位（现货仓位为其相反数），返回 (len(thresholds), n) 的 int64 矩阵
+    - fundingRate >= 开仓阈值：期货空头（-1）
+    - fundingRate <= -开仓阈值：期货多头（1）
+    - 阈值范围内：空头在 fundingRate < 平仓阈值 时平仓，多头在 fundingRate > -平仓阈值 时平仓，否则保持上一行仓位
+      （平仓阈值为 0 时即"fundingRate > 0 保留空头、平掉多头；fundingRate < 0 保留多头、平掉空头"）
+    - 第一行在阈值范围内时为 0
+    thresholds / close_thresholds 为标量或等长数组
+    向量化做法：最近一次"开仓/第一行"决定仓位方向，之后只要出现一次满足平仓条件的阈值内资费就平仓
+    """
+    rate = np.asarray(funding_rate, dtype=np.float64)
+    n = len(rate)
+    idx = np.arange(n)
+    thresholds, close_thresholds = np.broadcast_arrays(np.atleast_1d(np.asarray(thresholds, dtype=np.float64)),
+                                                       np.atleast_1d(np.asarray(close_thresholds, dtype=np.float64)))
+    open_th = thresholds[:, None]
+    close_th = close_thresholds[:, None]
+    short_open = rate >= open_th
+    long_open = rate <= -open_th
+    in_band = ~(short_open | long_open)
+
+    # 开仓行（以及第一行）直接决定仓位
+    anchor = ~in_band
+    anchor[:, :1] = True
+    anchor_value = np.where(short_open, -1, np.where(long_open, 1, 0))
+    last_anchor = np.maximum.accumulate(np.where(anchor, idx, 0), axis=1)
+    value = np.take_along_axis(anchor_value, last_anchor, axis=1)
+
+    # 开仓后第一次出现满足平仓条件的阈值内资费时平仓，平仓后到下一次开仓之前保持空仓
+    close_long = np.cumsum(in_band & (rate > -close_th), axis=1)
+    close_short = np.cumsum(in_band & (rate < close_th), axis=1)
+    closed = np.where(value == 1, close_long - np.take_along_axis(close_long, last_anchor, axis=1),
+                      np.where(value == -1, close_short - np.take_along_axis(close_short, last_anchor, axis=1), 0)) > 0
+    return np.where(closed, 0, value).astype(np.int64)
+
+
+def funding_positions(funding_rate, threshold=THRESHOLD, close_threshold=0.0):
+    """
+    根据资费计算每一行的期货仓位（现货仓位为其相反数），规则见 funding_position_matrix
+    """
+    return funding_position_matrix(funding_rate, threshold, close_threshold)[0]
+
+
+def _print_positions(rate, futures, threshold):
+    # verbose 模式下逐行打印交易逻辑
+    for idx in range(len(rate)):
+        print(idx)
+        print(rate[idx])
+        if rate[idx] >= threshold:
+            print('futures:-1')
+        elif rate[idx] <= -threshold:
+            print('futures:1')
+        elif idx == 0:
+            print('keep')
+        elif rate[idx] > 0 or rate[idx] < 0:
+            print('keep' if futures[idx] != 0 else 'position closed')
+
+
+def funding_arbitrage_strategy(threshold=THRESHOLD, verbose=False, input_file=INPUT_FILE, output_file=OUTPUT_FILE,
+                               close_threshold=0.0):
     """
     加密货币资费套利策略
     - 当fundingRate >= 阈值时：开仓期货空头+现货多头
     - 当fundingRate <= -阈值时：开仓期货多头+现货空头  
-    - 当fundingRate方向反转时：平仓
+    - 当fundingRate方向反转时：平仓（close_threshold 不为 0 时按平仓阈值，见 funding_position_matrix）
+    verbose=True 时逐行打印交易逻辑
     """
     
     # 读取数据
-    df = pd.read_csv(INPUT_FILE)
+    df = pd.read_csv(input_file)
     print(f"读取数据：{len(df)} 行")
     
-    # 初始化仓位列
-    df['futures_position'] = 0  # 正数表示多头，负数表示空头，0表示无仓位
-    df['spot_position'] = 0     # 正数表示多头，负数表示空头，0表示无仓位
-
-    for idx in range(len(df)):
-        print(idx)
-        funding_rate = float(df.iloc[idx]['fundingRate'])
-        print(funding_rate)
-        # 执行交易逻辑
-        if funding_rate >= THRESHOLD:
-            # fundingRate >= 阈值的情况
-            df.iloc[idx, df.columns.get_loc('futures_position')] = -1
-            df.iloc[idx, df.columns.get_loc('spot_position')] = 1
-            print('futures:-1')
-        elif funding_rate <= -THRESHOLD:
-            # fundingRate <= -阈值的情况
-                df.iloc[idx, df.columns.get_loc('futures_position')] = 1
-                df.iloc[idx, df.columns.get_loc('spot_position')] = -1
-                print('futures:1')
-        else:
-            # fundingRate在阈值范围内的情况
-            #如果第一条数据，忽略
-            if idx == 0:
-                print('keep')
-                df.iloc[idx, df.columns.get_loc('futures_position')] = 0
-                df.iloc[idx, df.columns.get_loc('spot_position')] = 0
-            else:
-                if funding_rate > 0:
-                    if df.iloc[(idx-1), df.columns.get_loc('futures_position')] < 0:
-                        print('keep')
-                        df.iloc[idx, df.columns.get_loc('futures_position')] = -1
-                        df.iloc[idx, df.columns.get_loc('spot_position')] = 1
-                    else:
-                        df.iloc[idx, df.columns.get_loc('futures_position')] = 0
-                        df.iloc[idx, df.columns.get_loc('spot_position')] = 0
-                        print('position closed')
-                elif funding_rate < 0:
-                    if df.iloc[(idx-1), df.columns.get_loc('futures_position')] > 0:
-                        print('keep')
-                        df.iloc[idx, df.columns.get_loc('futures_position')] = 1
-                        df.iloc[idx, df.columns.get_loc('spot_position')] = -1
-                    else:
-                        df.iloc[idx, df.columns.get_loc('futures_position')] = 0
-                        df.iloc[idx, df.columns.get_loc('spot_position')] = 0
-                        print('position closed')
-                else:
-                    df.iloc[idx, df.columns.get_loc('futures_position')] = df.iloc[(idx-1), df.columns.get_loc('futures_position')]
-                    df.iloc[idx, df.columns.get_loc('spot_position')] = df.iloc[(idx-1), df.columns.get_loc('spot_position')]
+    # 计算仓位：正数表示多头，负数表示空头，0表示无仓位
+    funding_rate = df['fundingRate'].to_numpy(dtype=np.float64)
+    futures = funding_positions(funding_rate, threshold, close_threshold)
+    df['futures_position'] = futures
+    df['spot_position'] = -futures
+    if verbose:
+        _print_positions(funding_rate, futures, threshold)
                     
     # 输出结果
     # 将position列向下移动一行
@@ -98,8 +119,9 @@ def funding_arbitrage_strategy():
     # 删除辅助列
     df = df.drop(['lastSpotPrice', 'lastFuturesPrice'], axis=1)
     
-    df.to_csv(OUTPUT_FILE, index=False)
-    print(f"策略结果已保存到：{OUTPUT_FILE}")
+    df.to_csv(output_file, index=False)
+    print(f"策略结果已保存到：{output_file}")
+    return df
     
 if __name__ == "__main__":
     funding_arbitrage_strategy()
\ No newline at end of file
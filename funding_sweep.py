@@ -0,0 +1,97 @@
+import os
+import numpy as np
+import pandas as pd
+from funding_arbitrage_strategy import INPUT_FILE, funding_position_matrix
+from metrics import bar_interval_ms, compute_metrics
+from render import heatmap_panel, render_heatmaps
+
+# 资费套利的阈值遍历：所有 (开仓阈值, 平仓阈值) 组合的仓位 / pnl 一次算成 (组合数, 行数) 矩阵，只读一次数据
+# 平仓阈值为 0 时与 funding_arbitrage_strategy 的原始规则相同
+OPEN_THRESHOLDS = [0.00005, 0.0001, 0.00015, 0.0002, 0.0003, 0.0004, 0.0005]
+CLOSE_THRESHOLDS = [-0.00005, 0.0, 0.00005]
+OUTPUT_DIR = 'kline'
+HEATMAP_METRICS = ['sharpe_ratio', 'total_pnl']
+
+
+def funding_pnl_matrix(df, positions):
+    """
+    positions 为 (K, n) 的期货仓位（未移位），与 funding_arbitrage_strategy 相同：用上一行的仓位计算本行 pnl
+    返回 {'fundingRatePnL', 'basisPnL', 'totalPnL'}，每个为 (K, n) 矩阵
+    价格缺失（merge_fundingRate_prices 对超出容差 / 没有的价格输出 NaN）导致的 NaN pnl 记为 0，
+    与 funding_arbitrage_strategy 中 cumsum / sum 跳过 NaN 的结果一致；totalPnL 在任一项为 NaN 时整行记为 0
+    """
+    rate = df['fundingRate'].to_numpy(dtype=np.float64)
+    mark = df['markPrice'].to_numpy(dtype=np.float64)
+    spot = df['spotPrice'].to_numpy(dtype=np.float64)
+    fut = df['futuresPrice'].to_numpy(dtype=np.float64)
+    futures = np.zeros(positions.shape)
+    futures[:, 1:] = positions[:, :-1]
+    spot_position = np.zeros(positions.shape)
+    spot_position[:, 1:] = -positions[:, :-1]
+
+    funding_pnl = (rate * mark) * futures * (-1)
+    # 第一行的上一价格取当前价格，收益为 0
+    spot_return = np.zeros(len(spot))
+    spot_return[1:] = spot[1:] / spot[:-1] - 1
+    fut_return = np.zeros(len(fut))
+    fut_return[1:] = fut[1:] / fut[:-1] - 1
+    basis_pnl = spot_position * spot_return + futures * fut_return
+    total_pnl = funding_pnl + basis_pnl
+    return {name: np.where(np.isnan(values), 0.0, values) for name, values in
+            [('fundingRatePnL', funding_pnl), ('basisPnL', basis_pnl), ('totalPnL', total_pnl)]}
+
+
+def funding_sweep(input_file=INPUT_FILE, open_thresholds=OPEN_THRESHOLDS, close_thresholds=CLOSE_THRESHOLDS):
+    """
+    遍历所有 (开仓阈值, 平仓阈值) 组合，每组一行：
+    funding_pnl / basis_pnl / total_pnl、sharpe_ratio（按资费结算间隔年化）、max_drawdown、flips（仓位变化次数）、exposure
+    """
+    df = pd.read_csv(input_file)
+    print(f"读取数据：{len(df)} 行，{len(open_thresholds)} x {len(close_thresholds)} 组阈值")
+    pairs = [(o, c) for o in open_thresholds for c in close_thresholds]
+    positions = funding_position_matrix(df['fundingRate'].to_numpy(dtype=np.float64),
+                                        [p[0] for p in pairs], [p[1] for p in pairs])
+    pnl = funding_pnl_matrix(df, positions)
+    bar_ms = bar_interval_ms(df['fundingTime'].to_numpy()) if len(df) > 1 else 8 * 60 * 60 * 1000
+    metrics = compute_metrics(pnl['totalPnL'], positions, bar_ms=bar_ms)
+    flips = np.count_nonzero(np.diff(positions, axis=1, prepend=0), axis=1)
+    return pd.DataFrame({
+        'open_threshold': [p[0] for p in pairs],
+        'close_threshold': [p[1] for p in pairs],
+        'funding_pnl': pnl['fundingRatePnL'].sum(axis=1),
+        'basis_pnl': pnl['basisPnL'].sum(axis=1),
+        'total_pnl': metrics['final_cpnl'],
+        'sharpe_ratio': metrics['sharpe_ratio'],
+        'max_drawdown': metrics['max_drawdown'],
+        'flips': flips,
+        'exposure': metrics['exposure'],
+    })
+
+
+def plot_funding_heatmaps(summary_df, output_dir=OUTPUT_DIR, metrics=HEATMAP_METRICS):
+    """
+    每个指标一张热力图（行：平仓阈值，列：开仓阈值），返回生成的文件列表
+    """
+    files = []
+    for metric in metrics:
+        pivot = summary_df.pivot(index='close_threshold', columns='open_threshold', values=metric)
+        panel = heatmap_panel(pivot, f'Funding Arbitrage {metric}', 'open_threshold (开仓阈值)', 'close_threshold (平仓阈值)')
+        heatmap_file = os.path.join(output_dir, f'funding_{metric}_heatmap.png')
+        files.append(render_heatmaps(heatmap_file, [panel], panel_size=(12, 6), fmt='.4g', cbar_label=metric))
+    return files
+
+
+if __name__ == "__main__":
+    summary_df = funding_sweep()
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    summary_file = os.path.join(OUTPUT_DIR, 'funding_threshold_summary.csv')
+    summary_df.to_csv(summary_file, index=False)
+    print(summary_df.to_string(index=False))
+    print(f"汇总结果已保存到: {summary_file}")
+
+    best = summary_df.loc[summary_df['sharpe_ratio'].idxmax()]
+    print(f"\n最佳阈值(按Sharpe Ratio): open_threshold = {best['open_threshold']:g}，close_threshold = {best['close_threshold']:g}")
+    print(f"  total_pnl = {best['total_pnl']:.6f}，Sharpe Ratio = {best['sharpe_ratio']:.2f}，flips = {best['flips']:.0f}")
+
+    for heatmap_file in plot_funding_heatmaps(summary_df):
+        print(f"热力图已保存到: {heatmap_file}")
@@ -0,0 +1,114 @@
+import contextlib
+import cProfile
+import csv
+import io
+import json
+import pstats
+import time
+
+# 可选的分阶段计时和计数（读数据、z_score、持仓、pnl、to_csv、savefig、参数遍历 ...）
+# 默认关闭：关闭时 stage() 返回共享的空上下文、count() 直接返回，不计时也不分配对象
+# 只统计当前进程，多进程遍历中 worker 内部的耗时合计在父进程的 'sweep' 阶段里
+ENABLED = False
+
+# 导出时附带的速率：名称 -> (计数器, 阶段)
+RATES = {
+    'combos_per_second': ('combos', 'sweep'),
+    'rows_per_second': ('rows', 'read_data'),
+}
+
+_timers = {}
+_counters = {}
+_NULL = contextlib.nullcontext()
+
+
+def enable(enabled=True):
+    global ENABLED
+    ENABLED = enabled
+
+
+def reset():
+    _timers.clear()
+    _counters.clear()
+
+
+class _Stage:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        entry = _timers.setdefault(self.name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += time.perf_counter() - self.start
+        return False
+
+
+def stage(name):
+    """
+    with stage('to_csv'): ... 累计该阶段的调用次数和耗时
+    """
+    if not ENABLED:
+        return _NULL
+    return _Stage(name)
+
+
+def count(name, n=1):
+    """
+    累加计数器（rows / bytes_written / combos ...）
+    """
+    if ENABLED:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def report():
+    stages = [{'stage': name, 'calls': calls, 'seconds': seconds} for name, (calls, seconds) in _timers.items()]
+    rates = {}
+    for name, (counter, stage_name) in RATES.items():
+        seconds = _timers.get(stage_name, (0, 0.0))[1]
+        if counter in _counters and seconds > 0:
+            rates[name] = _counters[counter] / seconds
+    return {'stages': stages, 'counters': dict(_counters), 'rates': rates}
+
+
+def export(prefix):
+    """
+    写出 prefix.json 和 prefix.csv（kind, name, calls, value），返回两个文件名
+    """
+    data = report()
+    json_file, csv_file = prefix + '.json', prefix + '.csv'
+    with open(json_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+    with open(csv_file, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['kind', 'name', 'calls', 'value'])
+        for s in data['stages']:
+            writer.writerow(['stage', s['stage'], s['calls'], s['seconds']])
+        for name, value in data['counters'].items():
+            writer.writerow(['counter', name, '', value])
+        for name, value in data['rates'].items():
+            writer.writerow(['rate', name, '', value])
+    return json_file, csv_file
+
+
+def profile(func, *args, profile_file=None, top=30, **kwargs):
+    """
+    在 cProfile 下运行一次 func(*args, **kwargs)，返回 func 的返回值
+    profile_file 不为空时写出 .prof（可用 snakeviz / pstats 查看）和按累计耗时排序的前 top 行文本
+    """
+    profiler = cProfile.Profile()
+    result = profiler.runcall(func, *args, **kwargs)
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(top)
+    if profile_file:
+        profiler.dump_stats(profile_file)
+        with open(profile_file + '.txt', 'w', encoding='utf-8') as f:
+            f.write(stream.getvalue())
+    else:
+        print(stream.getvalue())
+    return result
@@ -0,0 +1,128 @@
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+# 缓存目录为 <csv文件>.cache/，每列一个二进制文件 <列名>.bin，schema.json 记录列类型、行数和源文件指纹
+CACHE_SUFFIX = '.cache'
+SCHEMA_FILE = 'schema.json'
+CHUNK_ROWS = 1000000
+
+
+def cache_dir(csv_file):
+    return csv_file + CACHE_SUFFIX
+
+
+def source_fingerprint(csv_file):
+    """
+    源文件指纹：大小 + 修改时间，文件被替换或追加后缓存自动失效
+    """
+    st = os.stat(csv_file)
+    return {'path': os.path.abspath(csv_file), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+
+def write_cache(chunks, path, source=None):
+    """
+    把 DataFrame 分块流式写成列式二进制缓存
+    - chunks: 可迭代的 DataFrame 块，列和第一块保持一致，dtype 以第一块为准
+    - source: 写入 schema 的源文件指纹
+    先写到临时目录，完成后再替换旧缓存，读到的缓存总是完整的
+    """
+    tmp = f'{path}.tmp-{os.getpid()}'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    columns = None
+    files = {}
+    rows = 0
+    try:
+        for chunk in chunks:
+            if columns is None:
+                columns = [{'name': str(c), 'dtype': chunk[c].to_numpy().dtype.str} for c in chunk.columns]
+                files = {c['name']: open(os.path.join(tmp, c['name'] + '.bin'), 'wb') for c in columns}
+            for c in columns:
+                values = np.ascontiguousarray(chunk[c['name']].to_numpy(dtype=np.dtype(c['dtype'])))
+                files[c['name']].write(values.tobytes())
+            rows += len(chunk)
+    finally:
+        for f in files.values():
+            f.close()
+    if columns is None:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise ValueError('no data to cache')
+
+    schema = {'rows': rows, 'columns': columns, 'source': source}
+    with open(os.path.join(tmp, SCHEMA_FILE), 'w', encoding='utf-8') as f:
+        json.dump(schema, f, indent=2)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp, path)
+    return schema
+
+
+def build_cache(csv_file, chunk_rows=CHUNK_ROWS):
+    """
+    把 kline CSV 分块解析一次，写成列式二进制缓存
+    """
+    chunks = pd.read_csv(csv_file, chunksize=chunk_rows)
+    return write_cache(chunks, cache_dir(csv_file), source=source_fingerprint(csv_file))
+
+
+def read_schema(path):
+    schema_file = os.path.join(path, SCHEMA_FILE)
+    if not os.path.exists(schema_file):
+        return None
+    with open(schema_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def ensure_cache(csv_file):
+    """
+    缓存不存在或源文件指纹不一致时重新生成，返回 schema
+    schema 中没有源文件指纹的缓存是直接写成的数据（unzip_marketData.merge_csv_files / aggTrades_to_bars.build_bars
+    的 output_format='cache'），没有对应的CSV，缓存本身就是数据，直接使用
+    """
+    schema = read_schema(cache_dir(csv_file))
+    if schema is not None and schema.get('source') is None:
+        return schema
+    if schema is None or schema.get('source') != source_fingerprint(csv_file):
+        print(f"生成列式缓存: {cache_dir(csv_file)}")
+        schema = build_cache(csv_file)
+    return schema
+
+
+def map_columns(path, columns=None):
+    """
+    以只读 memmap 方式打开缓存目录中的列，只映射需要的列，多个进程共享同一份页缓存
+    """
+    schema = read_schema(path)
+    if schema is None:
+        raise FileNotFoundError(f'no column cache at {path}')
+    dtypes = {c['name']: c['dtype'] for c in schema['columns']}
+    names = list(dtypes) if columns is None else list(columns)
+    result = {}
+    for name in names:
+        if name not in dtypes:
+            raise KeyError(f'column {name} not in cache {path}')
+        if schema['rows'] == 0:
+            result[name] = np.empty(0, dtype=dtypes[name])
+        else:
+            result[name] = np.memmap(os.path.join(path, name + '.bin'), dtype=dtypes[name], mode='r', shape=(schema['rows'],))
+    return result
+
+
+def load_columns(csv_file, columns=None):
+    """
+    读取 kline 数据的若干列（零拷贝 memmap），首次调用时自动生成缓存
+    """
+    ensure_cache(csv_file)
+    return map_columns(cache_dir(csv_file), columns)
+
+
+def read_klines(csv_file, columns=None):
+    """
+    pd.read_csv(csv_file) 的替代：返回由 memmap 列构成的 DataFrame，columns 不为空时只映射这些列
+    pandas 把同 dtype 的多列合并成一个块时（取决于 pandas 版本）会把这些列复制到内存，不保证零拷贝，
+    只需要少数几列时应传 columns（或直接用 load_columns 得到 memmap 数组）
+    新增列正常写入内存
+    """
+    return pd.DataFrame(load_columns(csv_file, columns), copy=False)
@@ -0,0 +1,114 @@
+import glob
+import io
+import os
+import zipfile
+import numpy as np
+import pandas as pd
+
+# 把资费事件与现货 / 期货价格序列按时间做向后 as-of 关联，生成 funding_arbitrage_strategy 使用的 fundingRate_with_prices.csv
+# 价格取 fundingTime 时刻（含）之前最近的一笔价格，超过 TOLERANCE_MS 的旧价格视为缺失
+FUNDING_FILE = 'fundingRate.csv'
+SYMBOL = 'BTCUSDT'
+SPOT_SOURCE = './marketData/spot'          # 现货 zip 目录
+SPOT_DATATYPE = 'klines'                   # 'klines' 或 'aggTrades'
+FUTURES_SOURCE = './marketData/futures'    # 期货 zip 目录
+FUTURES_DATATYPE = 'klines'
+TOLERANCE_MS = 60 * 60 * 1000
+CHUNK_ROWS = 1000000
+OUTPUT_FILE = 'fundingRate_with_prices.csv'
+
+# (时间列, 价格列) 的位置：kline 用收盘时间和收盘价，aggTrades 用成交时间和成交价
+PRICE_COLUMNS = {
+    'klines': (6, 4),
+    'aggTrades': (5, 1),
+}
+
+
+def _has_header(zip_ref, name):
+    with zip_ref.open(name) as source:
+        first = io.TextIOWrapper(source, encoding='utf-8').readline()
+    return not first.split(',')[0].strip().isdigit()
+
+
+def iter_price_chunks(zip_files, datatype='klines', chunk_rows=CHUNK_ROWS):
+    """
+    分块读取 zip 中的价格序列，每块返回 (时间毫秒数组, 价格数组)，块内按时间排序
+    只解析时间和价格两列，内存只与 chunk_rows 有关
+    """
+    time_col, price_col = PRICE_COLUMNS[datatype]
+    for zip_file in zip_files:
+        with zipfile.ZipFile(zip_file, 'r') as zip_ref:
+            for name in zip_ref.namelist():
+                if not name.endswith('.csv'):
+                    continue
+                skip = 1 if _has_header(zip_ref, name) else 0
+                with zip_ref.open(name) as source:
+                    reader = pd.read_csv(source, header=None, skiprows=skip, usecols=[time_col, price_col],
+                                         chunksize=chunk_rows)
+                    for chunk in reader:
+                        times = chunk[time_col].to_numpy(dtype=np.int64)
+                        # 新版现货数据的时间戳是微秒
+                        times = np.where(times >= 10 ** 15, times // 1000, times)
+                        prices = chunk[price_col].to_numpy(dtype=np.float64)
+                        order = np.argsort(times, kind='stable')
+                        yield times[order], prices[order]
+
+
+def asof_join(event_times, chunks, tolerance_ms=TOLERANCE_MS):
+    """
+    向后 as-of 关联：对每个事件时间，取所有价格块中时间 <= 事件时间的最近一笔价格
+    每个价格块用 searchsorted 处理，只保留比已有结果更新的价格，所以价格块之间的顺序不影响结果
+    返回 (价格, 价格时间)，没有价格或超过容忍时间的为 NaN / -1
+    """
+    event_times = np.asarray(event_times, dtype=np.int64)
+    price = np.full(len(event_times), np.nan)
+    price_time = np.full(len(event_times), -1, dtype=np.int64)
+    for times, prices in chunks:
+        if len(times) == 0:
+            continue
+        pos = np.searchsorted(times, event_times, side='right') - 1
+        found = pos >= 0
+        pos = np.where(found, pos, 0)
+        newer = found & (times[pos] > price_time)
+        price[newer] = prices[pos[newer]]
+        price_time[newer] = times[pos[newer]]
+    stale = (price_time < 0) | (event_times - price_time > tolerance_ms)
+    price[stale] = np.nan
+    return price, price_time
+
+
+def build_funding_with_prices(funding_file=FUNDING_FILE, symbol=SYMBOL,
+                              spot_source=SPOT_SOURCE, spot_datatype=SPOT_DATATYPE,
+                              futures_source=FUTURES_SOURCE, futures_datatype=FUTURES_DATATYPE,
+                              tolerance_ms=TOLERANCE_MS, output_file=OUTPUT_FILE):
+    """
+    读取资费记录，关联现货价格 spotPrice 和期货价格 futuresPrice，写出 output_file
+    资费记录中没有 markPrice 时用 futuresPrice 代替
+    """
+    df = pd.read_csv(funding_file)
+    if 'symbol' in df.columns and symbol:
+        df = df[df['symbol'] == symbol]
+    df = df.sort_values('fundingTime', kind='stable').drop_duplicates('fundingTime').reset_index(drop=True)
+    event_times = df['fundingTime'].to_numpy(dtype=np.int64)
+    print(f"资费记录：{len(df)} 行")
+
+    for column, source, datatype in [('spotPrice', spot_source, spot_datatype),
+                                     ('futuresPrice', futures_source, futures_datatype)]:
+        zip_files = sorted(glob.glob(os.path.join(source, '*.zip')))
+        price, price_time = asof_join(event_times, iter_price_chunks(zip_files, datatype), tolerance_ms)
+        df[column] = price
+        df[column + 'Time'] = price_time
+        print(f"{column}：{len(zip_files)} 个文件，{int(np.isnan(price).sum())} 行缺失")
+
+    if 'markPrice' not in df.columns:
+        df['markPrice'] = df['futuresPrice']
+    else:
+        df['markPrice'] = pd.to_numeric(df['markPrice'], errors='coerce').fillna(df['futuresPrice'])
+
+    df.to_csv(output_file, index=False)
+    print(f"结果已保存到：{output_file}")
+    return df
+
+
+if __name__ == "__main__":
+    build_funding_with_prices()
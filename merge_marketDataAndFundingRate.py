@@ -1,7 +1,11 @@
 import csv
 import datetime
 import json
+import os
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from urllib.parse import urlencode
 import urllib.request
 import urllib.error
@@ -9,8 +13,14 @@ import urllib.error
 API_BASE = 'https://fapi.binance.com/fapi/v1/fundingRate'
 START_PARAM = '20240101000000'  # format: YYYYMMDDHHMMSS
 END_PARAM = '20251031235959'    # format: YYYYMMDDHHMMSS
-SYMBOL_PARAM = 'BTCUSDT'        # example: BTCUSDT
-MAX_DAYS = 30
+SYMBOLS_PARAM = ['BTCUSDT']     # example: ['BTCUSDT', 'ETHUSDT']
+OUTPUT_FILE = 'fundingRate.csv'
+LIMIT = 1000                    # 每次请求最多返回的记录数（接口上限 1000）
+MIN_FUNDING_INTERVAL_HOURS = 1  # 最短资费间隔，请求窗口 = LIMIT * 最短间隔，保证单个窗口不超过上限
+WORKERS = 4                     # 并发请求数
+RATE_LIMIT = 500                # fundingRate 接口限频：每 RATE_PERIOD 秒 500 次（与 fundingInfo 共享）
+RATE_PERIOD = 300
+RETRIES = 3
 
 
 def parse_time_arg(s):
@@ -27,13 +37,15 @@ def parse_time_arg(s):
     raise ValueError('time must be in YYYYMMDDHHMMSS format')
 
 
-def fetch_funding_rate(symbol, start_ms, end_ms, timeout=30):
+def fetch_funding_rate(symbol, start_ms, end_ms, timeout=30, limit=None, api_base=None):
     params = {
         'symbol': symbol,
         'startTime': str(start_ms),
         'endTime': str(end_ms),
     }
-    url = API_BASE + '?' + urlencode(params)
+    if limit:
+        params['limit'] = str(limit)
+    url = (api_base or API_BASE) + '?' + urlencode(params)
     req = urllib.request.Request(url, headers={'User-Agent': 'binance-funding-csv/1.0'})
     try:
         with urllib.request.urlopen(req, timeout=timeout) as resp:
@@ -46,15 +58,19 @@ def fetch_funding_rate(symbol, start_ms, end_ms, timeout=30):
         raise
 
 
-def write_csv(records, outpath, write_header=True):
+def write_csv(records, outpath, write_header=True, fieldnames=None):
+    """
+    追加写入记录，返回使用的列名（fieldnames 为空时由记录推断），之后的追加应使用同一组列名
+    """
     if not records:
-        return
-    keys = set()
-    for r in records:
-        keys.update(r.keys())
-    preferred = ['symbol', 'fundingTime', 'fundingRate']
-    other = [k for k in sorted(keys) if k not in preferred]
-    fieldnames = [k for k in preferred if k in keys] + other + ['fundingTime_str']
+        return fieldnames
+    if fieldnames is None:
+        keys = set()
+        for r in records:
+            keys.update(r.keys())
+        preferred = ['symbol', 'fundingTime', 'fundingRate']
+        other = [k for k in sorted(keys) if k not in preferred]
+        fieldnames = [k for k in preferred if k in keys] + other + ['fundingTime_str']
 
     with open(outpath, 'a', newline='', encoding='utf-8') as f:
         writer = csv.DictWriter(f, fieldnames=fieldnames)
@@ -70,11 +86,146 @@ def write_csv(records, outpath, write_header=True):
             except Exception:
                 row['fundingTime_str'] = ''
             writer.writerow(row)
+    return fieldnames
+
+
+class TokenBucket:
+    """
+    令牌桶限频：容量 capacity，每 period 秒补满，acquire() 在没有令牌时阻塞等待
+    """
+
+    def __init__(self, capacity=RATE_LIMIT, period=RATE_PERIOD):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, weight=1):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= weight:
+                    self.tokens -= weight
+                    return
+                wait = (weight - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def split_windows(start_ms, end_ms, window_ms):
+    windows = []
+    while start_ms <= end_ms:
+        windows.append((start_ms, min(start_ms + window_ms - 1, end_ms)))
+        start_ms += window_ms
+    return windows
+
+
+def fetch_window(bucket, symbol, start_ms, end_ms, api_base=None, retries=RETRIES):
+    """
+    获取一个时间窗口内的全部资费记录：返回条数达到 LIMIT 时从最后一条之后继续翻页
+    请求失败时指数退避重试
+    """
+    records = []
+    while start_ms <= end_ms:
+        attempt = 0
+        while True:
+            bucket.acquire()
+            try:
+                recs = fetch_funding_rate(symbol, start_ms, end_ms, limit=LIMIT, api_base=api_base)
+                break
+            except Exception:
+                attempt += 1
+                if attempt > retries:
+                    raise
+                time.sleep(2 ** attempt)
+        records.extend(recs)
+        if len(recs) < LIMIT:
+            break
+        start_ms = int(recs[-1]['fundingTime']) + 1
+    return records
+
+
+def read_existing(outpath):
+    """
+    读取已有的输出文件，返回 (表头, 已有的 (symbol, fundingTime) 集合, 每个 symbol 最后的 fundingTime)
+    """
+    if not os.path.exists(outpath) or os.path.getsize(outpath) == 0:
+        return None, set(), {}
+    keys = set()
+    last = {}
+    with open(outpath, 'r', newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        for r in reader:
+            try:
+                ts = int(r['fundingTime'])
+            except (KeyError, TypeError, ValueError):
+                continue
+            keys.add((r.get('symbol', ''), ts))
+            last[r.get('symbol', '')] = max(last.get(r.get('symbol', ''), ts), ts)
+    return reader.fieldnames, keys, last
+
+
+def fetch_all(symbols, start_ms, end_ms, outpath, api_base=None, workers=WORKERS, bucket=None):
+    """
+    并发获取多个 symbol 的资费并增量写入 outpath
+    - 每个 symbol 从输出文件中最后一条记录之后开始（断点续传）
+    - 每个窗口完成后立即写入：同一 symbol 的窗口按时间顺序写（前面的窗口还没完成时先缓存），按 (symbol, fundingTime) 去重
+    - 某个窗口重试后仍然失败时，该 symbol 之后的窗口不再写入，文件保持到最后写入的时间戳为止都是完整的，
+      其他 symbol 继续写完，最后抛出异常；重新运行会从断点继续
+    返回新写入的记录数
+    """
+    fieldnames, keys, last = read_existing(outpath)
+    bucket = bucket or TokenBucket()
+    window_ms = LIMIT * MIN_FUNDING_INTERVAL_HOURS * 3600 * 1000
+    windows = {}
+    for symbol in symbols:
+        symbol_start = max(start_ms, last.get(symbol, start_ms - 1) + 1)
+        windows[symbol] = split_windows(symbol_start, end_ms, window_ms)
+    print(f'{sum(len(w) for w in windows.values())} windows to fetch for {len(symbols)} symbols')
+
+    done = {symbol: {} for symbol in symbols}     # 已完成但还不能写入的窗口：下标 -> 记录
+    next_index = {symbol: 0 for symbol in symbols}
+    errors = {}
+    count = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(fetch_window, bucket, symbol, w_start, w_end, api_base=api_base): (symbol, i)
+                   for symbol in symbols for i, (w_start, w_end) in enumerate(windows[symbol])}
+        for future in as_completed(futures):
+            symbol, i = futures[future]
+            try:
+                done[symbol][i] = future.result()
+            except Exception as e:
+                errors.setdefault(symbol, e)
+                continue
+            if symbol in errors:
+                continue
+            while next_index[symbol] in done[symbol]:
+                k = next_index[symbol]
+                recs = done[symbol].pop(k)
+                w_start, w_end = windows[symbol][k]
+                print(f'  {symbol} {w_start} ~ {w_end}: {len(recs)} records')
+                new_records = {}
+                for r in recs:
+                    key = (r.get('symbol', symbol), int(r['fundingTime']))
+                    if key not in keys:
+                        new_records[key] = r
+                keys.update(new_records)
+                records = [new_records[key] for key in sorted(new_records)]
+                if records:
+                    fieldnames = write_csv(records, outpath, write_header=fieldnames is None, fieldnames=fieldnames)
+                count += len(records)
+                next_index[symbol] += 1
+    if errors:
+        failed = ', '.join(f'{symbol}: {e}' for symbol, e in errors.items())
+        raise RuntimeError(f'{count} new records written, failed windows: {failed}')
+    return count
 
 
 def main():
-    if not SYMBOL_PARAM:
-        print('SYMBOL_PARAM must be set at the top of the script', file=sys.stderr)
+    if not SYMBOLS_PARAM:
+        print('SYMBOLS_PARAM must be set at the top of the script', file=sys.stderr)
         sys.exit(2)
     try:
         start_dt, start_ms = parse_time_arg(START_PARAM)
@@ -87,31 +238,13 @@ def main():
         print('START_PARAM and END_PARAM must be provided at the top of the script', file=sys.stderr)
         sys.exit(2)
 
-    print(f'Fetching fundingRate for {SYMBOL_PARAM} from {start_dt} to {end_dt}...')
-    outpath = 'fundingRate.csv'
-    first_batch = True
-    batch_start = start_dt
-    batch_num = 1
-    while batch_start < end_dt:
-        batch_end = batch_start + datetime.timedelta(days=MAX_DAYS)
-        if batch_end > end_dt:
-            batch_end = end_dt
-        batch_start_ms = int(batch_start.replace(tzinfo=datetime.timezone.utc).timestamp() * 1000)
-        batch_end_ms = int(batch_end.replace(tzinfo=datetime.timezone.utc).timestamp() * 1000)
-        print(f'Batch {batch_num}: {batch_start} ~ {batch_end}')
-        print(f'  Request params: start_ms={batch_start_ms}, end_ms={batch_end_ms}')
-        try:
-            recs = fetch_funding_rate(SYMBOL_PARAM, batch_start_ms, batch_end_ms)
-        except Exception as e:
-            print('Failed to fetch data:', e, file=sys.stderr)
-            sys.exit(1)
-        print(f'  Got {len(recs)} records')
-        write_csv(recs, outpath, write_header=first_batch)
-        print(f'  Written to {outpath} (header={first_batch})')
-        first_batch = False
-        batch_start = batch_end
-        batch_num += 1
-    print(f'All batches done. Output: {outpath}')
+    print(f'Fetching fundingRate for {", ".join(SYMBOLS_PARAM)} from {start_dt} to {end_dt}...')
+    try:
+        count = fetch_all(SYMBOLS_PARAM, start_ms, end_ms, OUTPUT_FILE)
+    except Exception as e:
+        print('Failed to fetch data:', e, file=sys.stderr)
+        sys.exit(1)
+    print(f'Done. {count} new records written to {OUTPUT_FILE}')
 
 if __name__ == '__main__':
     main()
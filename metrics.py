@@ -0,0 +1,111 @@
+import numpy as np
+
+# 一次计算大量策略的绩效指标：输入为 (K, n) 矩阵，每行是一组参数在 n 根K线上的 pnl / 持仓
+# （与 sweep_engine / position_engine 的矩阵方向一致）
+# 按行分块计算，每块的临时数组不超过 BLOCK_ELEMENTS 个元素（能放进 CPU 缓存），内存占用与 K 无关
+BLOCK_ELEMENTS = 1 << 18
+YEAR_MS = 365 * 24 * 60 * 60 * 1000
+
+METRIC_NAMES = ['final_cpnl', 'sharpe_ratio', 'sortino_ratio', 'max_drawdown', 'max_drawdown_bars',
+                'hit_rate', 'turnover', 'hp', 'exposure']
+
+
+def bar_interval_ms(open_time):
+    """
+    由 open_time 推断K线周期（相邻时间差的中位数，毫秒）
+    """
+    open_time = np.asarray(open_time, dtype=np.int64)
+    if len(open_time) < 2:
+        raise ValueError('need at least two bars to infer the bar interval')
+    return int(np.median(np.diff(open_time)))
+
+
+def annualization(bar_ms):
+    """
+    年化系数 sqrt(每年K线数)；1h K线为 sqrt(8760) ≈ 93.6，即原来写死的 94
+    """
+    return np.sqrt(YEAR_MS / bar_ms)
+
+
+def _blocks(K, n, block_elements):
+    rows = max(1, block_elements // max(n, 1))
+    for start in range(0, K, rows):
+        yield slice(start, min(start + rows, K))
+
+
+def compute_metrics(pnl, position=None, close=None, bar_ms=60 * 60 * 1000, block_elements=BLOCK_ELEMENTS):
+    """
+    pnl: (K, n)；position: (K, n) 或 None；close: (n,) 或 None（None 时按价格为 1 计算 gmv / turnover）
+    返回 {指标名: (K,) 数组}
+    - final_cpnl：累计 pnl
+    - sharpe_ratio：mean / std(ddof=1) * sqrt(每年K线数)
+    - sortino_ratio：mean / sqrt(mean(min(pnl, 0)^2)) * sqrt(每年K线数)
+    - max_drawdown / max_drawdown_bars：累计 pnl（从 0 开始）相对历史最高点的最大回撤及最长回撤持续K线数
+    - hit_rate：pnl 不为 0 的K线中 pnl > 0 的比例
+    以下需要 position：
+    - turnover：每根K线平均换手 |position - last_position| * close
+    - hp：持仓周期 sum|gmv| / sum(turnover) * 2
+    - exposure：持仓不为 0 的K线比例
+    """
+    pnl = np.atleast_2d(pnl)
+    K, n = pnl.shape
+    factor = annualization(bar_ms)
+    out = {name: np.zeros(K) for name in METRIC_NAMES}
+    out['max_drawdown_bars'] = np.zeros(K, dtype=np.int64)
+    if position is not None:
+        position = np.atleast_2d(position)
+        price = np.ones(n) if close is None else np.asarray(close, dtype=np.float64)
+    if n == 0:
+        return out
+
+    # 每块复用同一组缓冲区，块足够小时临时数据留在 CPU 缓存里
+    rows_per_block = max(1, block_elements // n)
+    buf = np.empty((rows_per_block, n))
+    cpnl_buf = np.empty((rows_per_block, n))
+    flag_buf = np.empty((rows_per_block, n), dtype=bool)
+    peak_mask = np.ones((rows_per_block, n + 2), dtype=bool)
+
+    for rows in _blocks(K, n, block_elements):
+        p = pnl[rows]
+        b = len(p)
+        work, cpnl, flag = buf[:b], cpnl_buf[:b], flag_buf[:b]
+        # 与 sweep_engine.sharpe_ratios 相同的均值；平方和用 einsum 省掉一次整块遍历
+        mean = p.sum(axis=1) / n
+        np.subtract(mean[:, None], p, out=work)
+        std = np.sqrt(np.einsum('ij,ij->i', work, work) / (n - 1)) if n > 1 else np.zeros(b)
+        np.minimum(p, 0.0, out=work)
+        downside = np.sqrt(np.einsum('ij,ij->i', work, work) / n)
+        active = np.not_equal(p, 0.0, out=flag).sum(axis=1)
+        wins = np.greater(p, 0.0, out=flag).sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            out['sharpe_ratio'][rows] = np.where(std != 0, mean / std * factor, 0)
+            out['sortino_ratio'][rows] = np.where(downside != 0, mean / downside * factor, 0)
+            out['hit_rate'][rows] = np.where(active > 0, wins / active, 0)
+
+        np.cumsum(p, axis=1, out=cpnl)
+        out['final_cpnl'][rows] = cpnl[:, -1]
+        # 回撤 = max(历史最高累计 pnl, 0) - 累计 pnl
+        np.maximum.accumulate(cpnl, axis=1, out=work)
+        np.maximum(work, 0.0, out=work)
+        np.subtract(work, cpnl, out=work)
+        out['max_drawdown'][rows] = work.max(axis=1)
+        # 回撤持续时间：相邻两次处于最高点之间的K线数，每行首尾加哨兵（起点 0 视为下标 -1 处的最高点）
+        mask = peak_mask[:b]
+        np.equal(work, 0.0, out=mask[:, 1:-1])
+        flat = np.flatnonzero(mask)
+        gaps = np.diff(flat) - 1
+        starts = np.searchsorted(flat, np.arange(b) * (n + 2))
+        out['max_drawdown_bars'][rows] = np.maximum.reduceat(gaps, starts) if len(gaps) else 0
+
+        if position is not None:
+            pos = work
+            np.copyto(pos, position[rows])
+            out['exposure'][rows] = np.not_equal(pos, 0.0, out=flag).sum(axis=1) / n
+            gmv = np.abs(pos, out=cpnl) @ price
+            trade = cpnl[:, 1:]
+            np.subtract(pos[:, 1:], pos[:, :-1], out=trade)
+            trade = np.abs(trade, out=trade) @ price[1:]
+            out['turnover'][rows] = trade / n
+            with np.errstate(divide='ignore', invalid='ignore'):
+                out['hp'][rows] = np.where(trade != 0, gmv / trade * 2, 0)
+    return out
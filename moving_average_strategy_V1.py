@@ -1,49 +1,78 @@
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-import seaborn as sns
+from parallel_sweep import run_sweep
+from sweep_engine import settle_zscore
+from kline_cache import read_klines
+from sweep_artifacts import check_metric, select_combos, emit_artifacts
+import instrument
+from result_store import STORE_FILE
+from render import PlotRenderer, heatmap_panel
 
-def moving_average_strategy(csv_file, M, N, z_open):
-    # 读取数据
-    df = pd.read_csv(csv_file)
-    
-    # 生成 ma 列
-    df['ma'] = df['close'].rolling(window=M).mean()
-    # 计算 close 的 rolling z-score（观察期M）
-    rolling_mean = df['close'].rolling(window=M).mean()
-    rolling_std = df['close'].rolling(window=M).std()
-    df['close_zscore'] = (df['close'] - rolling_mean) / rolling_std
-    
-    # 生成 signal 列：z_score > z_open 做多，z_score < -z_open 做空，其他为 0
-    df['signal'] = np.where(df['close_zscore'] > z_open, 1, np.where(df['close_zscore'] < -z_open, -1, 0))
-    # 前 M 个信号设为 0（因为没有足够数据计算z_score）
-    df.loc[:M-1, 'signal'] = 0
-    
-    # 计算 open_signal 和 position
-    df['open_signal'] = df['signal']
-    df['position'] = df['open_signal'].rolling(window=N, min_periods=1).sum()
-    
-    # 计算 return 和 pnl
-    # return = close / last_close - 1
-    df['return'] = df['close'] / df['close'].shift(1) - 1
-    df['return'] = df['return'].fillna(0)  # 第一行填充为0
-    
-    # pnl = return * last_position
-    df['pnl'] = df['return'] * df['position'].shift(1)  # shift(1) 获取上一期的position
-    df['pnl'] = df['pnl'].fillna(0)  # 第一行没有last position，填充为0
-    
-    # cpnl = 累计 PNL
-    df['cpnl'] = df['pnl'].cumsum()
+# 参数遍历只在内存中计算汇总指标，遍历结束后只为排名前 TOP_K 的组合（按 ARTIFACT_METRIC 从大到小）生成明细CSV和PNL图
+# ARTIFACT_COMBOS 可以指定明确的参数列表，例如 [{'M': 20, 'N': 32, 'z_open': 1.2}]
+ARTIFACT_METRIC = 'final_cpnl'
+TOP_K = 10
+ARTIFACT_COMBOS = None
+# INSTRUMENT=True 时记录各阶段耗时和计数，与汇总结果一起保存为 kline/strategy_timings_V1.json / .csv
+# PROFILE_COMBO 指定一组参数（如 {'M': 20, 'N': 32, 'z_open': 1.2}）时在 cProfile 下单独运行一次
+INSTRUMENT = False
+PROFILE_COMBO = None
+# 结果库（见 result_store）：重复运行时只计算库里没有的参数组合，None 表示每次全部重新计算
+RESULT_STORE = STORE_FILE
+
+def moving_average_strategy(csv_file, M, N, z_open, write_artifacts=True, renderer=None):
+    # 读取数据（列式 memmap 缓存，首次读取时由 CSV 生成）
+    # 只计算指标时只映射 open_time / close，写明细CSV时才读取全部列
+    with instrument.stage('read_data'):
+        df = read_klines(csv_file, None if write_artifacts else ['open_time', 'close'])
+    instrument.count('rows', len(df))
+    
+    with instrument.stage('zscore'):
+        # 生成 ma 列
+        df['ma'] = df['close'].rolling(window=M).mean()
+        # 计算 close 的 rolling z-score（观察期M）
+        rolling_mean = df['close'].rolling(window=M).mean()
+        rolling_std = df['close'].rolling(window=M).std()
+        # 平坦窗口为 NaN、|z_score| 极小时为 0（见 sweep_engine.settle_zscore）
+        df['close_zscore'] = settle_zscore((df['close'] - rolling_mean) / rolling_std, df['close'].to_numpy(), M)
+    
+    with instrument.stage('signals'):
+        # 生成 signal 列：z_score > z_open 做多，z_score < -z_open 做空，其他为 0
+        df['signal'] = np.where(df['close_zscore'] > z_open, 1, np.where(df['close_zscore'] < -z_open, -1, 0))
+        # 前 M 个信号设为 0（因为没有足够数据计算z_score）
+        df.loc[:M-1, 'signal'] = 0
+    
+    with instrument.stage('positions'):
+        # 计算 open_signal 和 position
+        df['open_signal'] = df['signal']
+        df['position'] = df['open_signal'].rolling(window=N, min_periods=1).sum()
+    
+    with instrument.stage('pnl'):
+        # 计算 return 和 pnl
+        # return = close / last_close - 1
+        df['return'] = df['close'] / df['close'].shift(1) - 1
+        df['return'] = df['return'].fillna(0)  # 第一行填充为0
+        
+        # pnl = return * last_position
+        df['pnl'] = df['return'] * df['position'].shift(1)  # shift(1) 获取上一期的position
+        df['pnl'] = df['pnl'].fillna(0)  # 第一行没有last position，填充为0
+        
+        # cpnl = 累计 PNL
+        df['cpnl'] = df['pnl'].cumsum()
     
     # 删除临时列
     # df.drop(columns=['ma', 'signal'], inplace=True)
     
-    # 保存结果到 kline 文件夹
+    # 保存结果到 kline 文件夹（write_artifacts=False 时只计算指标，不写明细CSV和图表）
     import os
-    os.makedirs('kline', exist_ok=True)
-    output_file = f'kline/merged_data_with_strategy_M{M}_N{N}_z{z_open}.csv'
-    df.to_csv(output_file, index=False)
-    print(f"\nResult saved to: {output_file}")
+    if write_artifacts:
+        os.makedirs('kline', exist_ok=True)
+        output_file = f'kline/merged_data_with_strategy_M{M}_N{N}_z{z_open}.csv'
+        with instrument.stage('to_csv'):
+            df.to_csv(output_file, index=False)
+        instrument.count('bytes_written', os.path.getsize(output_file))
+        print(f"\nResult saved to: {output_file}")
     
     # 绘制 cpnl 图表
     # 生成 signal 列：z_score > 0 做多，z_score < 0 做空，其他为 0
@@ -53,25 +82,35 @@ def moving_average_strategy(csv_file, M, N, z_open):
     pnl_std = df['pnl'].std()
     sharpe_ratio = (pnl_mean / pnl_std * 94) if pnl_std != 0 else 0
     
-    # 绘制累计PNL曲线，横轴为时间（open_time），纵轴为累计PNL
-    plt.figure(figsize=(12, 6))
-    if 'open_time' in df.columns:
-        x = pd.to_datetime(df['open_time'], unit='ms')
-        plt.plot(x, df['cpnl'], linewidth=1.5, color='blue')
-        plt.xlabel('Time', fontsize=12)
-    else:
-        plt.plot(df.index, df['cpnl'], linewidth=1.5, color='blue')
-        plt.xlabel('Index', fontsize=12)
-    plt.title(f'Cumulative PNL - M={M}, N={N}, z_open={z_open}, Sharpe Ratio={sharpe_ratio:.2f}', fontsize=14, fontweight='bold')
-    plt.ylabel('Cumulative PNL', fontsize=12)
-    plt.grid(True, alpha=0.3)
-    plt.tight_layout()
-    
-    # 保存图表到 kline 文件夹
-    plot_file = f'kline/cpnl_plot_M{M}_N{N}_z{z_open}.png'
-    plt.savefig(plot_file, dpi=150)
-    print(f"Plot saved to: {plot_file}")
-    plt.close()
+    if write_artifacts and renderer is not None:
+        # 交给渲染进程（见 render.PlotRenderer），PNL图与后续计算并行生成
+        plot_file = f'kline/cpnl_plot_M{M}_N{N}_z{z_open}.png'
+        open_time = df['open_time'].to_numpy() if 'open_time' in df.columns else None
+        renderer.cpnl(plot_file, df['cpnl'].to_numpy(), open_time,
+                      title=f'Cumulative PNL - M={M}, N={N}, z_open={z_open}, Sharpe Ratio={sharpe_ratio:.2f}')
+        print(f"Plot queued: {plot_file}")
+    elif write_artifacts:
+        # 绘制累计PNL曲线，横轴为时间（open_time），纵轴为累计PNL
+        plt.figure(figsize=(12, 6))
+        if 'open_time' in df.columns:
+            x = pd.to_datetime(df['open_time'], unit='ms')
+            plt.plot(x, df['cpnl'], linewidth=1.5, color='blue')
+            plt.xlabel('Time', fontsize=12)
+        else:
+            plt.plot(df.index, df['cpnl'], linewidth=1.5, color='blue')
+            plt.xlabel('Index', fontsize=12)
+        plt.title(f'Cumulative PNL - M={M}, N={N}, z_open={z_open}, Sharpe Ratio={sharpe_ratio:.2f}', fontsize=14, fontweight='bold')
+        plt.ylabel('Cumulative PNL', fontsize=12)
+        plt.grid(True, alpha=0.3)
+        plt.tight_layout()
+    
+        # 保存图表到 kline 文件夹
+        plot_file = f'kline/cpnl_plot_M{M}_N{N}_z{z_open}.png'
+        with instrument.stage('savefig'):
+            plt.savefig(plot_file, dpi=150)
+        instrument.count('bytes_written', os.path.getsize(plot_file))
+        print(f"Plot saved to: {plot_file}")
+        plt.close()
     
     return df, sharpe_ratio
 
@@ -82,42 +121,22 @@ if __name__ == "__main__":
     N_values = [4,8,12,16,20,24,28,32,36,40,44,48,52,56,60, 64,68,72,76,80,84,88,92,96,100,104,108,112,116,120]
     z_open_values = [1.2,1.4,1.6,1.8,2.0]
     
-    # 存储结果
-    results_summary = []
-    
     print("="*60)
-    print(f"开始参数遍历: {len(M_values)} x {len(N_values)} = {len(M_values) * len(N_values)} 组参数")
+    print(f"开始参数遍历: {len(M_values)} x {len(N_values)} x {len(z_open_values)} = {len(M_values) * len(N_values) * len(z_open_values)} 组参数")
     print("="*60)
+    instrument.enable(INSTRUMENT)
+    if ARTIFACT_COMBOS is None:
+        check_metric('V1', ARTIFACT_METRIC)
     
-    # 遍历所有参数组合
-    for M in M_values:
-        for N in N_values:
-            for z_open in z_open_values:
-                print(f"\n运行策略: M={M}, N={N}, z_open={z_open}")
-                try:
-                    result_df, sharpe_ratio = moving_average_strategy('klineData.csv', M=M, N=N, z_open=z_open)
-                    # 记录关键指标
-                    final_cpnl = result_df['cpnl'].iloc[-1]
-                    total_signals = (result_df['open_signal'] != 0).sum()
-                    max_position = result_df['position'].abs().max()
-                    results_summary.append({
-                        'M': M,
-                        'N': N,
-                        'z_open': z_open,
-                        'final_cpnl': final_cpnl,
-                        'sharpe_ratio': sharpe_ratio,
-                        'total_signals': total_signals,
-                        'max_position': max_position
-                    })
-                    print(f"  最终累计PNL: {final_cpnl:.6f}, Sharpe Ratio: {sharpe_ratio:.2f}")
-                except Exception as e:
-                    print(f"  错误: {e}")
+    # 多进程遍历所有参数组合：每个M只计算一次z_score，所有N由signal前缀和一次得到（见 sweep_engine.v1_sweep_M）
+    # 单个组合的明细CSV和PNL图可以用 moving_average_strategy(...) 单独生成
+    results_summary = run_sweep('klineData.csv', 'V1', M_values, N_values, z_open_values, store_file=RESULT_STORE)
     
     # 保存汇总结果
     summary_df = pd.DataFrame(results_summary)
     import os
     os.makedirs('kline', exist_ok=True)
-    summary_file = 'kline/strategy_summary.csv'
+    summary_file = 'kline/strategy_summary_V1.csv'
     summary_df.to_csv(summary_file, index=False)
     print("\n" + "="*60)
     print("参数遍历完成！")
@@ -133,22 +152,36 @@ if __name__ == "__main__":
         print(f"  最终累计PNL = {best_result['final_cpnl']:.6f}")
         print(f"  Sharpe Ratio = {best_result['sharpe_ratio']:.2f}")
         
+        # 只为选中的组合生成明细CSV和PNL图
+        combos = select_combos(summary_df, ['M', 'N', 'z_open'], ARTIFACT_METRIC, TOP_K, combos=ARTIFACT_COMBOS)
+        # 热力图和明细PNL图交给渲染进程生成（见 render.PlotRenderer），与明细CSV的计算 / 写出并行
+        renderer = PlotRenderer()
+        
         # 生成每个z_open的Sharpe Ratio热力图
         print("\n生成 Sharpe Ratio 热力图...")
+        heatmap_files = []
         for z_open in sorted(summary_df['z_open'].unique()):
             sub_df = summary_df[summary_df['z_open'] == z_open]
             heatmap_data = sub_df.pivot(index='N', columns='M', values='sharpe_ratio')
-            plt.figure(figsize=(14, 10))
-            sns.heatmap(heatmap_data, annot=True, fmt='.2f', cmap='RdYlGn', 
-                        center=0, cbar_kws={'label': 'Sharpe Ratio'})
-            plt.title(f'Sharpe Ratio Heatmap (z_open={z_open})', fontsize=16, fontweight='bold')
-            plt.xlabel('M (均线周期)', fontsize=12)
-            plt.ylabel('N (持仓时间)', fontsize=12)
-            plt.tight_layout()
+            panel = heatmap_panel(heatmap_data, f'Sharpe Ratio Heatmap (z_open={z_open})', 'M (均线周期)', 'N (持仓时间)')
             heatmap_file = f'kline/sharpe_ratio_heatmap_z{z_open}.png'
-            plt.savefig(heatmap_file, dpi=150)
+            renderer.heatmaps(heatmap_file, [panel], panel_size=(14, 10))
+            heatmap_files.append(heatmap_file)
+        
+        print(f"\n生成 {len(combos)} 组参数的明细...")
+        emit_artifacts(moving_average_strategy, 'klineData.csv', combos, renderer)
+        with instrument.stage('render_wait'):
+            renderer.close()
+        for heatmap_file in heatmap_files:
             print(f"热力图已保存到: {heatmap_file}")
-            plt.close()
+        
+        if PROFILE_COMBO:
+            profile_file = 'kline/profile_V1.prof'
+            instrument.profile(moving_average_strategy, 'klineData.csv', profile_file=profile_file, **PROFILE_COMBO)
+            print(f"性能分析已保存到: {profile_file}")
+        if INSTRUMENT:
+            for timing_file in instrument.export('kline/strategy_timings_V1'):
+                print(f"阶段耗时已保存到: {timing_file}")
         print("\n所有任务完成！")
 
     
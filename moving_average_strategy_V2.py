@@ -1,77 +1,77 @@
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-import seaborn as sns
+from position_engine import hysteresis_positions, position_pnl
+from parallel_sweep import run_sweep
+from sweep_engine import settle_zscore
+from kline_cache import read_klines
+from sweep_artifacts import check_metric, select_combos, emit_artifacts
+import instrument
+from result_store import STORE_FILE
+from render import PlotRenderer, heatmap_panel
 
-def moving_average_strategy(csv_file, M, z_open, z_close):
-    # 读取数据
-    df = pd.read_csv(csv_file)
-    
-    # 生成 ma 列
-    df['ma'] = df['close'].rolling(window=M).mean()
-    # 计算 close 的 rolling z-score（观察期M）
-    rolling_mean = df['close'].rolling(window=M).mean()
-    rolling_std = df['close'].rolling(window=M).std()
-    df['close_zscore'] = (df['close'] - rolling_mean) / rolling_std
-    
-    # 生成开仓信号：z_score > z_open 做多，z_score < -z_open 做空
-    df['open_signal'] = np.where(df['close_zscore'] > z_open, 1, 
-                                  np.where(df['close_zscore'] < (-z_open), -1, 0))
-    # 前 M 个信号设为 0（因为没有足够数据计算z_score）
-    df.loc[:M-1, 'open_signal'] = 0
-    
-    # 计算 position（持仓状态）
-    df['position'] = 0
-    current_position = 0
-    
-    for i in range(len(df)):
-        z_score = df.loc[i, 'close_zscore']
-        
-        # 平仓逻辑
-        if current_position == 1:  # 持有多头
-            # 当 z_score < z_close 并且 z_score >= 0 时，平掉多头
-            if z_score < z_close and z_score > 0:
-                current_position = 0
-        elif current_position == -1:  # 持有空头
-            # 当 z_score > -z_close 并且 z_score <= 0 时，平掉空头
-            if z_score > (-z_close) and z_score < 0:
-                current_position = 0
-        
-        # 开仓逻辑（在没有持仓的情况下）
-        if current_position == 0 and df.loc[i, 'open_signal'] != 0:
-            current_position = df.loc[i, 'open_signal']
-        
-        df.loc[i, 'position'] = current_position
-    
-    # 计算 GMV 和 turnover
+# 参数遍历只在内存中计算汇总指标，遍历结束后只为排名前 TOP_K 的组合（按 ARTIFACT_METRIC 从大到小）生成明细CSV和PNL图
+# ARTIFACT_COMBOS 可以指定明确的参数列表，例如 [{'M': 20, 'z_open': 1.0, 'z_close': 0.3}]
+ARTIFACT_METRIC = 'final_cpnl'
+TOP_K = 10
+ARTIFACT_COMBOS = None
+# INSTRUMENT=True 时记录各阶段耗时和计数，与汇总结果一起保存为 kline/strategy_timings_V2.json / .csv
+# PROFILE_COMBO 指定一组参数（如 {'M': 20, 'z_open': 1.0, 'z_close': 0.3}）时在 cProfile 下单独运行一次
+INSTRUMENT = False
+PROFILE_COMBO = None
+# 结果库（见 result_store）：重复运行时只计算库里没有的参数组合，None 表示每次全部重新计算
+RESULT_STORE = STORE_FILE
+
+def moving_average_strategy(csv_file, M, z_open, z_close, write_artifacts=True, renderer=None):
+    # 读取数据（列式 memmap 缓存，首次读取时由 CSV 生成）
+    # 只计算指标时只映射 open_time / close，写明细CSV时才读取全部列
+    with instrument.stage('read_data'):
+        df = read_klines(csv_file, None if write_artifacts else ['open_time', 'close'])
+    instrument.count('rows', len(df))
+    
+    with instrument.stage('zscore'):
+        # 生成 ma 列
+        df['ma'] = df['close'].rolling(window=M).mean()
+        # 计算 close 的 rolling z-score（观察期M）
+        rolling_mean = df['close'].rolling(window=M).mean()
+        rolling_std = df['close'].rolling(window=M).std()
+        # 平坦窗口为 NaN、|z_score| 极小时为 0（见 sweep_engine.settle_zscore）
+        df['close_zscore'] = settle_zscore((df['close'] - rolling_mean) / rolling_std, df['close'].to_numpy(), M)
+    
+    with instrument.stage('signals'):
+        # 生成开仓信号：z_score > z_open 做多，z_score < -z_open 做空
+        df['open_signal'] = np.where(df['close_zscore'] > z_open, 1, 
+                                      np.where(df['close_zscore'] < (-z_open), -1, 0))
+        # 前 M 个信号设为 0（因为没有足够数据计算z_score）
+        df.loc[:M-1, 'open_signal'] = 0
+    
+    with instrument.stage('positions'):
+        # 计算 position（持仓状态），开平仓状态机见 position_engine.hysteresis_positions
+        df['position'] = hysteresis_positions(df['close_zscore'].to_numpy(), M, z_open, z_close)[0]
+    
+    # 计算 GMV / turnover / return / pnl / cpnl
     # GMV = position * closePrice
-    df['gmv'] = df['position'] * df['close']
-    
     # turnover = abs(position - lastPosition) * closePrice
-    df['turnover'] = abs(df['position'] - df['position'].shift(1)) * df['close']
-    df['turnover'] = df['turnover'].fillna(0)  # 第一行填充为0
-    
-    # 计算 return 和 pnl
     # return = close / last_close - 1
-    df['return'] = df['close'] / df['close'].shift(1) - 1
-    df['return'] = df['return'].fillna(0)  # 第一行填充为0
-    
     # pnl = return * last_position
-    df['pnl'] = df['return'] * df['position'].shift(1)  # shift(1) 获取上一期的position
-    df['pnl'] = df['pnl'].fillna(0)  # 第一行没有last position，填充为0
-    
     # cpnl = 累计 PNL
-    df['cpnl'] = df['pnl'].cumsum()
+    with instrument.stage('pnl'):
+        columns = position_pnl(df['close'].to_numpy(), df['position'].to_numpy())
+        for col in ['gmv', 'turnover', 'return', 'pnl', 'cpnl']:
+            df[col] = columns[col]
     
     # 删除临时列
     # df.drop(columns=['ma', 'signal'], inplace=True)
     
-    # 保存结果到 kline 文件夹
+    # 保存结果到 kline 文件夹（write_artifacts=False 时只计算指标，不写明细CSV和图表）
     import os
-    os.makedirs('kline', exist_ok=True)
-    output_file = f'kline/merged_data_with_strategy_M{M}_z_open{z_open}_z_close{z_close}.csv'
-    df.to_csv(output_file, index=False)
-    print(f"\nResult saved to: {output_file}")
+    if write_artifacts:
+        os.makedirs('kline', exist_ok=True)
+        output_file = f'kline/merged_data_with_strategy_M{M}_z_open{z_open}_z_close{z_close}.csv'
+        with instrument.stage('to_csv'):
+            df.to_csv(output_file, index=False)
+        instrument.count('bytes_written', os.path.getsize(output_file))
+        print(f"\nResult saved to: {output_file}")
     
     # 绘制 cpnl 图表
     pnl_mean = df['pnl'].mean()
@@ -83,25 +83,35 @@ def moving_average_strategy(csv_file, M, z_open, z_close):
     sum_turnover = df['turnover'].sum()
     hp = (sum_gmv / sum_turnover * 2) if sum_turnover != 0 else 0
     
-    # 绘制累计PNL曲线，横轴为时间（open_time），纵轴为累计PNL
-    plt.figure(figsize=(12, 6))
-    if 'open_time' in df.columns:
-        x = pd.to_datetime(df['open_time'], unit='ms')
-        plt.plot(x, df['cpnl'], linewidth=1.5, color='blue')
-        plt.xlabel('Time', fontsize=12)
-    else:
-        plt.plot(df.index, df['cpnl'], linewidth=1.5, color='blue')
-        plt.xlabel('Index', fontsize=12)
-    plt.title(f'Cumulative PNL - M={M}, z_open={z_open}, z_close={z_close}, Sharpe={sharpe_ratio:.2f}, HP={hp:.0f}', fontsize=14, fontweight='bold')
-    plt.ylabel('Cumulative PNL', fontsize=12)
-    plt.grid(True, alpha=0.3)
-    plt.tight_layout()
+    if write_artifacts and renderer is not None:
+        # 交给渲染进程（见 render.PlotRenderer），PNL图与后续计算并行生成
+        plot_file = f'kline/cpnl_plot_M{M}_z_open{z_open}_z_close{z_close}.png'
+        open_time = df['open_time'].to_numpy() if 'open_time' in df.columns else None
+        renderer.cpnl(plot_file, df['cpnl'].to_numpy(), open_time,
+                      title=f'Cumulative PNL - M={M}, z_open={z_open}, z_close={z_close}, Sharpe={sharpe_ratio:.2f}, HP={hp:.0f}')
+        print(f"Plot queued: {plot_file}")
+    elif write_artifacts:
+        # 绘制累计PNL曲线，横轴为时间（open_time），纵轴为累计PNL
+        plt.figure(figsize=(12, 6))
+        if 'open_time' in df.columns:
+            x = pd.to_datetime(df['open_time'], unit='ms')
+            plt.plot(x, df['cpnl'], linewidth=1.5, color='blue')
+            plt.xlabel('Time', fontsize=12)
+        else:
+            plt.plot(df.index, df['cpnl'], linewidth=1.5, color='blue')
+            plt.xlabel('Index', fontsize=12)
+        plt.title(f'Cumulative PNL - M={M}, z_open={z_open}, z_close={z_close}, Sharpe={sharpe_ratio:.2f}, HP={hp:.0f}', fontsize=14, fontweight='bold')
+        plt.ylabel('Cumulative PNL', fontsize=12)
+        plt.grid(True, alpha=0.3)
+        plt.tight_layout()
     
-    # 保存图表到 kline 文件夹
-    plot_file = f'kline/cpnl_plot_M{M}_z_open{z_open}_z_close{z_close}.png'
-    plt.savefig(plot_file, dpi=150)
-    print(f"Plot saved to: {plot_file}")
-    plt.close()
+        # 保存图表到 kline 文件夹
+        plot_file = f'kline/cpnl_plot_M{M}_z_open{z_open}_z_close{z_close}.png'
+        with instrument.stage('savefig'):
+            plt.savefig(plot_file, dpi=150)
+        instrument.count('bytes_written', os.path.getsize(plot_file))
+        print(f"Plot saved to: {plot_file}")
+        plt.close()
     
     return df, sharpe_ratio, hp
 
@@ -112,43 +122,22 @@ if __name__ == "__main__":
     z_open_values = [0.6, 0.7, 0.8,0.9, 1.0, 1.1, 1.2,1.3,1.4,1.5]
     z_close_values = [0.1, 0.2, 0.3, 0.4, 0.5]
     
-    # 存储结果
-    results_summary = []
-    
     print("="*60)
     print(f"开始参数遍历: {len(M_values)} x {len(z_open_values)} x {len(z_close_values)} = {len(M_values) * len(z_open_values) * len(z_close_values)} 组参数")
     print("="*60)
+    instrument.enable(INSTRUMENT)
+    if ARTIFACT_COMBOS is None:
+        check_metric('V2', ARTIFACT_METRIC)
     
-    # 遍历所有参数组合
-    for M in M_values:
-        for z_open in z_open_values:
-            for z_close in z_close_values:
-                print(f"\n运行策略: M={M}, z_open={z_open}, z_close={z_close}")
-                try:
-                    result_df, sharpe_ratio, hp = moving_average_strategy('klineData.csv', M=M, z_open=z_open, z_close=z_close)
-                    # 记录关键指标
-                    final_cpnl = result_df['cpnl'].iloc[-1]
-                    total_signals = (result_df['open_signal'] != 0).sum()
-                    max_position = result_df['position'].abs().max()
-                    results_summary.append({
-                        'M': M,
-                        'z_open': z_open,
-                        'z_close': z_close,
-                        'final_cpnl': final_cpnl,
-                        'sharpe_ratio': sharpe_ratio,
-                        'hp': hp,
-                        'total_signals': total_signals,
-                        'max_position': max_position
-                    })
-                    print(f"  最终累计PNL: {final_cpnl:.6f}, Sharpe Ratio: {sharpe_ratio:.2f}, HP: {hp:.0f}")
-                except Exception as e:
-                    print(f"  错误: {e}")
+    # 多进程遍历所有参数组合：每个M只计算一次z_score，所有 (z_open, z_close) 一次算出持仓（见 sweep_engine.v2_sweep_M）
+    # 单个组合的明细CSV和PNL图可以用 moving_average_strategy(...) 单独生成
+    results_summary = run_sweep('klineData.csv', 'V2', M_values, z_open_values, z_close_values, store_file=RESULT_STORE)
     
     # 保存汇总结果
     summary_df = pd.DataFrame(results_summary)
     import os
     os.makedirs('kline', exist_ok=True)
-    summary_file = 'kline/strategy_summary.csv'
+    summary_file = 'kline/strategy_summary_V2.csv'
     summary_df.to_csv(summary_file, index=False)
     print("\n" + "="*60)
     print("参数遍历完成！")
@@ -165,38 +154,32 @@ if __name__ == "__main__":
         print(f"  最终累计PNL = {best_result['final_cpnl']:.6f}")
         print(f"  Sharpe Ratio = {best_result['sharpe_ratio']:.2f}")
         
+        # 只为选中的组合生成明细CSV和PNL图
+        combos = select_combos(summary_df, ['M', 'z_open', 'z_close'], ARTIFACT_METRIC, TOP_K, combos=ARTIFACT_COMBOS)
+        # 热力图和明细PNL图交给渲染进程生成（见 render.PlotRenderer），与明细CSV的计算 / 写出并行
+        renderer = PlotRenderer()
+        
         # 生成Sharpe Ratio热力图 - 所有M在同一张图
         print("\n生成 Sharpe Ratio 热力图...")
-        M_values = sorted(summary_df['M'].unique())
-        
-        # 计算子图布局（尽量接近正方形）
-        n_plots = len(M_values)
-        n_cols = int(np.ceil(np.sqrt(n_plots)))
-        n_rows = int(np.ceil(n_plots / n_cols))
-        
-        # 创建大图
-        fig, axes = plt.subplots(n_rows, n_cols, figsize=(6*n_cols, 5*n_rows))
-        axes = axes.flatten() if n_plots > 1 else [axes]
-        
-        for idx, M in enumerate(M_values):
+        panels = []
+        for M in sorted(summary_df['M'].unique()):
             sub_df = summary_df[summary_df['M'] == M]
             heatmap_data = sub_df.pivot(index='z_close', columns='z_open', values='sharpe_ratio')
-            
-            sns.heatmap(heatmap_data, annot=True, fmt='.2f', cmap='RdYlGn', 
-                        center=0, cbar_kws={'label': 'Sharpe Ratio'}, ax=axes[idx])
-            axes[idx].set_title(f'M={M}', fontsize=12, fontweight='bold')
-            axes[idx].set_xlabel('z_open (开仓阈值)', fontsize=10)
-            axes[idx].set_ylabel('z_close (平仓阈值)', fontsize=10)
-        
-        # 隐藏多余的子图
-        for idx in range(n_plots, len(axes)):
-            axes[idx].set_visible(False)
-        
-        plt.suptitle('Sharpe Ratio Heatmaps for Different M Values', fontsize=16, fontweight='bold', y=0.995)
-        plt.tight_layout()
-        
+            panels.append(heatmap_panel(heatmap_data, f'M={M}', 'z_open (开仓阈值)', 'z_close (平仓阈值)'))
         heatmap_file = 'kline/sharpe_ratio_heatmap_all_M.png'
-        plt.savefig(heatmap_file, dpi=150, bbox_inches='tight')
+        renderer.heatmaps(heatmap_file, panels, suptitle='Sharpe Ratio Heatmaps for Different M Values')
+        
+        print(f"\n生成 {len(combos)} 组参数的明细...")
+        emit_artifacts(moving_average_strategy, 'klineData.csv', combos, renderer)
+        with instrument.stage('render_wait'):
+            renderer.close()
         print(f"热力图已保存到: {heatmap_file}")
-        plt.close()
+        
+        if PROFILE_COMBO:
+            profile_file = 'kline/profile_V2.prof'
+            instrument.profile(moving_average_strategy, 'klineData.csv', profile_file=profile_file, **PROFILE_COMBO)
+            print(f"性能分析已保存到: {profile_file}")
+        if INSTRUMENT:
+            for timing_file in instrument.export('kline/strategy_timings_V2'):
+                print(f"阶段耗时已保存到: {timing_file}")
         print("\n所有任务完成!")
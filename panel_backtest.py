@@ -0,0 +1,146 @@
+import numpy as np
+import pandas as pd
+from kline_cache import load_columns
+from position_engine import open_signals, hysteresis_positions
+from sweep_engine import settle_zscore, sharpe_ratios
+
+# 多品种面板回测：按 open_time 对齐成 时间 x 品种 的收盘价矩阵，缺失位置为 NaN 并被屏蔽
+# z_score、信号、持仓、pnl 对所有品种一次计算；品种上市前 / 下市后的缺失不影响结果，
+# 与单品种 moving_average_strategy 的结果一致；中间缺失的K线视为无数据（该处及之后一根K线 pnl 为 0）
+CSV_FILES = {'BTCUSDT': 'klineData.csv'}
+STRATEGY = 'V2'
+PARAMS = {'M': 20, 'z_open': 1.0, 'z_close': 0.3}   # V1: {'M': .., 'N': .., 'z_open': ..}
+OUTPUT_FILE = 'kline/panel_summary.csv'
+
+
+def load_panel(csv_files):
+    """
+    读取多个品种的 kline，返回 (open_time, symbols, close)，close 为 (T, S) 矩阵，缺失为 NaN
+    """
+    symbols = list(csv_files)
+    series = []
+    for symbol in symbols:
+        cols = load_columns(csv_files[symbol], ['open_time', 'close'])
+        series.append(pd.Series(np.asarray(cols['close']), index=np.asarray(cols['open_time']), name=symbol))
+    panel = pd.concat(series, axis=1, join='outer').sort_index()
+    return panel.index.to_numpy(), symbols, panel.to_numpy(dtype=np.float64)
+
+
+def panel_zscore(close, M):
+    """
+    每列 close 的 rolling z-score，与单品种的 DataFrame 写法逐位一致
+    """
+    df = pd.DataFrame(close)
+    rolling_mean = df.rolling(window=M).mean()
+    rolling_std = df.rolling(window=M).std()
+    return settle_zscore(((df - rolling_mean) / rolling_std).to_numpy(), close, M)
+
+
+def _first_valid(close):
+    valid = ~np.isnan(close)
+    return np.where(valid.any(axis=0), valid.argmax(axis=0), len(close))
+
+
+def _returns(close):
+    # return = close / last_close - 1，第一行和缺失处为 0
+    ret = np.zeros(close.shape)
+    with np.errstate(invalid='ignore'):
+        ret[1:] = close[1:] / close[:-1] - 1
+    return np.nan_to_num(ret, nan=0.0)
+
+
+def panel_v1(close, M, N, z_open):
+    """
+    V1：所有品种一次计算，position = signal 在 N 窗口内的滚动和
+    """
+    zscore = panel_zscore(close, M)
+    first = _first_valid(close)
+    rank = np.arange(len(close))[:, None] - first[None, :]
+    signal = np.where(zscore > z_open, 1, np.where(zscore < -z_open, -1, 0))
+    # 每个品种的前 M 根K线信号设为 0
+    signal[rank < M] = 0
+    # 逐列前缀和得到 N 窗口滚动和
+    csum = np.vstack([np.zeros((1, close.shape[1]), dtype=np.int64), np.cumsum(signal, axis=0)])
+    idx = np.arange(1, len(close) + 1)
+    position = (csum[idx] - csum[np.maximum(idx - N, 0)]).astype(np.float64)
+    pnl = np.zeros(close.shape)
+    pnl[1:] = _returns(close)[1:] * position[:-1]
+    return {'signal': signal, 'position': position, 'pnl': pnl}
+
+
+def panel_v2(close, M, z_open, z_close):
+    """
+    V2：z_score、收益、pnl 按矩阵计算，开平仓状态机对每个品种从其第一根有效K线开始运行
+    """
+    zscore = panel_zscore(close, M)
+    first = _first_valid(close)
+    signal = np.zeros(close.shape, dtype=np.int64)
+    position = np.zeros(close.shape, dtype=np.int64)
+    for j, start in enumerate(first):
+        if start < len(close):
+            signal[start:, j] = open_signals(zscore[start:, j], M, z_open)[0]
+            position[start:, j] = hysteresis_positions(zscore[start:, j], M, z_open, z_close)[0]
+    filled = np.nan_to_num(close, nan=0.0)
+    gmv = position * filled
+    turnover = np.zeros(close.shape)
+    turnover[1:] = np.abs(position[1:].astype(np.float64) - position[:-1]) * filled[1:]
+    pnl = np.zeros(close.shape)
+    pnl[1:] = _returns(close)[1:] * position[:-1]
+    return {'signal': signal, 'position': position, 'gmv': gmv, 'turnover': turnover, 'pnl': pnl}
+
+
+def panel_metrics(close, result, symbols):
+    """
+    每个品种的 final_cpnl / sharpe_ratio / (hp) / total_signals / max_position，
+    以及 PORTFOLIO 行：每根K线对有数据的品种等权平均 pnl
+    """
+    valid = ~np.isnan(close)
+    rows = []
+    for j, symbol in enumerate(symbols):
+        mask = valid[:, j]
+        pnl = result['pnl'][mask, j]
+        row = {
+            'symbol': symbol,
+            'bars': int(mask.sum()),
+            'final_cpnl': np.cumsum(pnl)[-1] if len(pnl) else 0.0,
+            'sharpe_ratio': sharpe_ratios(pnl[None, :])[0] if len(pnl) > 1 else 0.0,
+        }
+        if 'turnover' in result:
+            sum_gmv = np.abs(result['gmv'][mask, j]).sum()
+            sum_turnover = result['turnover'][mask, j].sum()
+            row['hp'] = (sum_gmv / sum_turnover * 2) if sum_turnover != 0 else 0
+        row['total_signals'] = int((result['signal'][mask, j] != 0).sum())
+        row['max_position'] = np.abs(result['position'][mask, j]).max() if mask.any() else 0
+        rows.append(row)
+
+    active = valid.sum(axis=1)
+    portfolio = np.where(active > 0, result['pnl'].sum(axis=1) / np.maximum(active, 1), 0.0)
+    rows.append({
+        'symbol': 'PORTFOLIO',
+        'bars': len(close),
+        'final_cpnl': np.cumsum(portfolio)[-1] if len(portfolio) else 0.0,
+        'sharpe_ratio': sharpe_ratios(portfolio[None, :])[0] if len(portfolio) > 1 else 0.0,
+        'total_signals': sum(r['total_signals'] for r in rows),
+        'max_position': max((r['max_position'] for r in rows), default=0),
+    })
+    return pd.DataFrame(rows)
+
+
+def run_panel(csv_files, strategy, params):
+    open_time, symbols, close = load_panel(csv_files)
+    if strategy == 'V1':
+        result = panel_v1(close, params['M'], params['N'], params['z_open'])
+    elif strategy == 'V2':
+        result = panel_v2(close, params['M'], params['z_open'], params['z_close'])
+    else:
+        raise ValueError(f'unknown strategy: {strategy}')
+    return panel_metrics(close, result, symbols)
+
+
+if __name__ == "__main__":
+    import os
+    summary_df = run_panel(CSV_FILES, STRATEGY, PARAMS)
+    print(summary_df.to_string(index=False))
+    os.makedirs('kline', exist_ok=True)
+    summary_df.to_csv(OUTPUT_FILE, index=False)
+    print(f"汇总结果已保存到: {OUTPUT_FILE}")
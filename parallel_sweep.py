@@ -0,0 +1,157 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import instrument
+from kline_cache import ensure_cache, load_columns
+from result_store import PARAM_COLUMNS, ResultStore
+from sweep_engine import data_bar_ms, v1_sweep_M, v2_sweep_M
+
+# 默认进程数，None 表示使用全部CPU核
+WORKERS = None
+# 每个任务块包含的参数组合数，None 表示每个 M 一个任务块
+CHUNK_SIZE = None
+
+# 每个进程只映射一次数据（memmap，多个进程共享页缓存）
+_close = None
+
+
+def _load_data(csv_file):
+    global _close
+    _close = load_columns(csv_file, ['close'])['close']
+
+
+def _evaluate(strategy, M, combos, cost_levels=None, bar_ms=None):
+    if strategy == 'V1':
+        # combos 为 (N, z_open)，按 N x z_open 网格计算后取出需要的组合（有成本网格时每个组合对应多行）
+        N_values = sorted({c[0] for c in combos})
+        z_open_values = sorted({c[1] for c in combos})
+        rows = {}
+        for r in v1_sweep_M(_close, M, N_values, z_open_values, cost_levels, bar_ms):
+            rows.setdefault((r['N'], r['z_open']), []).append(r)
+        return [r for c in combos for r in rows[c]]
+    if strategy == 'V2':
+        # combos 为 (z_open, z_close)
+        return v2_sweep_M(_close, M, combos, cost_levels, bar_ms)
+    raise ValueError(f'unknown strategy: {strategy}')
+
+
+def _run_unit(unit):
+    strategy, M, combos, cost_levels, bar_ms = unit
+    try:
+        return _evaluate(strategy, M, combos, cost_levels, bar_ms), []
+    except Exception:
+        # 整块失败时逐个组合重跑，只跳过出错的组合
+        rows, errors = [], []
+        for combo in combos:
+            try:
+                rows.extend(_evaluate(strategy, M, [combo], cost_levels, bar_ms))
+            except Exception as e:
+                errors.append((M, combo, e))
+        return rows, errors
+
+
+def build_units(strategy, M_values, values_a, values_b, chunk_size=None, cost_levels=None, skip=None, bar_ms=None):
+    """
+    按串行遍历顺序（M -> a -> b）把参数组合切成任务块，每块只包含同一个 M
+    skip 为已有结果的 (M, a, b) 集合，这些组合不再生成任务
+    """
+    combos = [(M, a, b) for M in M_values for a in values_a for b in values_b]
+    return build_combo_units(strategy, combos, chunk_size, cost_levels, skip, bar_ms)
+
+
+def build_combo_units(strategy, combos, chunk_size=None, cost_levels=None, skip=None, bar_ms=None):
+    """
+    把任意的 (M, a, b) 组合列表按 M 分组（保持首次出现的顺序）切成任务块，跳过 skip 中的组合
+    bar_ms 为K线周期（毫秒），有成本网格时用于折算资金费率（见 sweep_engine.net_cost_metrics）
+    """
+    by_M = {}
+    for M, a, b in combos:
+        if not skip or (M, a, b) not in skip:
+            by_M.setdefault(M, []).append((a, b))
+    units = []
+    for M, todo in by_M.items():
+        size = chunk_size or len(todo)
+        for start in range(0, len(todo), size):
+            units.append((strategy, M, todo[start:start + size], cost_levels, bar_ms))
+    return units
+
+
+def run_sweep(csv_file, strategy, M_values, values_a, values_b, workers=WORKERS, chunk_size=CHUNK_SIZE,
+              cost_levels=None, store_file=None, bar_ms=None):
+    """
+    多进程参数网格遍历
+    - strategy='V1'：values_a 为 N_values，values_b 为 z_open_values
+    - strategy='V2'：values_a 为 z_open_values，values_b 为 z_close_values
+    - cost_levels：手续费 / 滑点 / 资金费率水平列表，不为空时每组参数按成本水平展开（见 sweep_engine.net_cost_metrics）
+    - bar_ms：K线周期（毫秒），用于把资金费率折算到每根K线；None 时由数据的 open_time 推断
+    - store_file：结果库路径（见 result_store），不为空时只计算库里没有的组合，每个任务块完成后立即写入库
+    结果顺序与串行遍历的 results_summary 完全一致；单个组合出错只打印错误并跳过（不写入库，下次重跑）
+    """
+    combos = [(M, a, b) for M in M_values for a in values_a for b in values_b]
+    return run_combos(csv_file, strategy, combos, workers, chunk_size, cost_levels, store_file, bar_ms)
+
+
+def run_combos(csv_file, strategy, combos, workers=WORKERS, chunk_size=CHUNK_SIZE, cost_levels=None, store_file=None,
+               bar_ms=None):
+    """
+    与 run_sweep 相同，但参数为任意的 (M, a, b) 组合列表（不要求是完整网格），结果按 combos 的顺序返回
+    """
+    if store_file and cost_levels:
+        raise ValueError('store_file does not support cost_levels')
+    workers = workers or os.cpu_count() or 1
+    combos = list(dict.fromkeys(combos))
+
+    # 在主进程中生成缓存，worker 只做映射
+    with instrument.stage('ensure_cache'):
+        ensure_cache(csv_file)
+    if cost_levels and bar_ms is None:
+        bar_ms = data_bar_ms(csv_file)
+    store = ResultStore(store_file) if store_file else None
+    try:
+        rows = {}
+        data_hash = None
+        if store is not None:
+            with instrument.stage('store_lookup'):
+                data_hash = store.data_hash(csv_file)
+                for key, row in store.lookup(data_hash, strategy, sorted({c[0] for c in combos})).items():
+                    rows[key] = [row]
+        units = build_combo_units(strategy, combos, chunk_size, cost_levels, skip=rows, bar_ms=bar_ms)
+        n_combos = sum(len(u[2]) for u in units)
+        n_cached = len(combos) - n_combos
+
+        start_time = time.perf_counter()
+        with instrument.stage('sweep'):
+            if not units:
+                n_errors = 0
+            elif workers == 1:
+                _load_data(csv_file)
+                n_errors = _collect(strategy, map(_run_unit, units), rows, store, data_hash)
+            else:
+                with ProcessPoolExecutor(max_workers=workers, initializer=_load_data, initargs=(csv_file,)) as executor:
+                    futures = [executor.submit(_run_unit, unit) for unit in units]
+                    n_errors = _collect(strategy, (f.result() for f in as_completed(futures)), rows, store, data_hash)
+        elapsed = time.perf_counter() - start_time
+    finally:
+        if store is not None:
+            store.close()
+    instrument.count('combos', n_combos - n_errors)
+
+    rate = n_combos / elapsed if elapsed > 0 else float('inf')
+    cached = f"，结果库命中 {n_cached} 组" if store_file else ""
+    print(f"完成 {n_combos} 组参数（失败 {n_errors} 组{cached}），用时 {elapsed:.2f}s，{rate:.1f} 组/秒（{workers} 进程，{len(units)} 个任务块）")
+    return [r for c in combos for r in rows.get(c, [])]
+
+
+def _collect(strategy, outputs, rows, store=None, data_hash=None):
+    # 按任务块完成顺序收集结果到 rows[(M, a, b)]，有结果库时每块立即写入
+    name_a, name_b = PARAM_COLUMNS[strategy]
+    n_errors = 0
+    for unit_rows, errors in outputs:
+        for r in unit_rows:
+            rows.setdefault((r['M'], r[name_a], r[name_b]), []).append(r)
+        if store is not None and unit_rows:
+            store.append(data_hash, strategy, unit_rows)
+        for M, combo, e in errors:
+            print(f"  错误: M={M}, 参数={combo}: {e}")
+        n_errors += len(errors)
+    return n_errors
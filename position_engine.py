@@ -0,0 +1,96 @@
+import numpy as np
+
+
+def open_signals(zscore, M, z_open):
+    """
+    开仓信号矩阵
+    - zscore: 长度为 n 的 z_score 序列
+    - z_open: 标量或长度为 K 的开仓阈值数组
+    返回 (K, n) 的 int64 矩阵：z_score > z_open 为 1，z_score < -z_open 为 -1，其他为 0
+    """
+    z = np.asarray(zscore, dtype=np.float64)
+    z_open = np.atleast_1d(np.asarray(z_open, dtype=np.float64))[:, None]
+    signal = np.where(z > z_open, 1, np.where(z < -z_open, -1, 0)).astype(np.int64)
+    # 前 M 个信号设为 0（因为没有足够数据计算z_score）
+    signal[:, :M] = 0
+    return signal
+
+
+def _next_index(mask):
+    # 对每个 i 给出 j >= i 中第一个 mask[j] 为 True 的下标，没有则为 n
+    n = mask.shape[-1]
+    idx = np.where(mask, np.arange(n), n)
+    return np.minimum.accumulate(idx[..., ::-1], axis=-1)[..., ::-1]
+
+
+def hysteresis_positions(zscore, M, z_open, z_close, initial=0):
+    """
+    V2 开平仓状态机的数组实现
+    - 空仓时：open_signal 非 0 则按 open_signal 开仓
+    - 持有多头：0 < z_score < z_close 时平仓
+    - 持有空头：-z_close < z_score < 0 时平仓
+    z_open / z_close 可以是标量或等长数组，一次计算 K 组 (z_open, z_close)，返回 (K, n) 的 int64 持仓矩阵
+    initial 为第一根K线之前的持仓（标量或长度为 K 的数组），分块计算时用上一块最后的持仓接着运行状态机
+
+    做法：先用逆序累计最小值算出每个位置之后第一个开仓点 / 平仓点，
+    然后按"开仓 -> 平仓 -> 开仓"跳转，循环次数只等于交易次数而不是K线数
+    """
+    z = np.asarray(zscore, dtype=np.float64)
+    n = len(z)
+    z_open, z_close = np.broadcast_arrays(np.atleast_1d(np.asarray(z_open, dtype=np.float64)),
+                                          np.atleast_1d(np.asarray(z_close, dtype=np.float64)))
+    signal = open_signals(z, M, z_open)
+    zc = z_close[:, None]
+    # 平仓后同一根K线会按 open_signal 重新开仓，所以 open_signal 与原方向相同的平仓点等于没有平仓
+    next_open = _next_index(signal != 0)
+    next_close_long = _next_index((z > 0) & (z < zc) & (signal != 1))
+    next_close_short = _next_index((z < 0) & (z > -zc) & (signal != -1))
+
+    initial = np.broadcast_to(np.asarray(initial, dtype=np.int64), z_open.shape)
+    position = np.zeros((len(z_open), n), dtype=np.int64)
+    for k in range(len(z_open)):
+        next_close = {1: next_close_long[k], -1: next_close_short[k]}
+        i = 0
+        if initial[k] != 0 and n > 0:
+            # 接着持有之前的仓位，第一根K线就可以平仓
+            end = next_close[initial[k]][0]
+            position[k, :end] = initial[k]
+            i = end + 1
+        while i < n:
+            start = next_open[k, i]
+            if start >= n:
+                break
+            side = signal[k, start]
+            end = next_close[side][start + 1] if start + 1 < n else n
+            position[k, start:end] = side
+            # 平仓那根K线的 open_signal 必为 0，从下一根开始找开仓点
+            i = end + 1
+    return position
+
+
+def position_pnl(close, position):
+    """
+    根据持仓计算 gmv / turnover / return / pnl / cpnl，position 可以是 (n,) 或 (K, n)
+    计算方式与 DataFrame 版本逐元素一致（结果完全相同）
+    """
+    close = np.asarray(close, dtype=np.float64)
+    position = np.asarray(position)
+
+    # GMV = position * closePrice
+    gmv = position * close
+
+    # turnover = abs(position - lastPosition) * closePrice，第一行为 0
+    turnover = np.zeros(position.shape, dtype=np.float64)
+    turnover[..., 1:] = np.abs(position[..., 1:].astype(np.float64) - position[..., :-1]) * close[1:]
+
+    # return = close / last_close - 1，第一行为 0
+    ret = np.zeros(len(close), dtype=np.float64)
+    ret[1:] = close[1:] / close[:-1] - 1
+
+    # pnl = return * last_position，第一行为 0
+    pnl = np.zeros(position.shape, dtype=np.float64)
+    pnl[..., 1:] = ret[1:] * position[..., :-1].astype(np.float64)
+
+    # cpnl = 累计 PNL
+    cpnl = np.cumsum(pnl, axis=-1)
+    return {'gmv': gmv, 'turnover': turnover, 'return': ret, 'pnl': pnl, 'cpnl': cpnl}
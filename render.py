@@ -0,0 +1,178 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+# 绘图子系统：PNL 曲线和热力图作为任务提交到独立的进程池（Agg 后端）中渲染，与回测计算并行
+# 每个进程按图的形状缓存 figure / axes / 线条 / 热力图 / 注释文本对象，之后的任务只更新数据再保存，不重建 figure
+RENDER_WORKERS = 2      # 0 表示在当前进程中同步渲染
+
+# 渲染进程内按形状缓存的图对象
+_figures = {}
+
+
+def _init_worker():
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def _pyplot():
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def render_cpnl(out_file, cpnl, open_time=None, title='', dpi=150):
+    """
+    累计PNL曲线：横轴为 open_time（毫秒）或下标，复用同一个 figure，只更新线条数据
+    """
+    import matplotlib.dates as mdates
+    plt = _pyplot()
+    dates = open_time is not None
+    key = ('cpnl', dates)
+    if key not in _figures:
+        fig, ax = plt.subplots(figsize=(12, 6))
+        line, = ax.plot([], [], linewidth=1.5, color='blue')
+        ax.set_xlabel('Time' if dates else 'Index', fontsize=12)
+        ax.set_ylabel('Cumulative PNL', fontsize=12)
+        ax.grid(True, alpha=0.3)
+        if dates:
+            ax.xaxis_date()
+        _figures[key] = (fig, ax, line)
+    fig, ax, line = _figures[key]
+    cpnl = np.asarray(cpnl, dtype=np.float64)
+    if dates:
+        x = mdates.date2num(np.asarray(open_time, dtype=np.int64).astype('datetime64[ms]'))
+    else:
+        x = np.arange(len(cpnl))
+    line.set_data(x, cpnl)
+    ax.relim()
+    ax.autoscale_view()
+    ax.set_title(title, fontsize=14, fontweight='bold')
+    fig.tight_layout()
+    fig.savefig(out_file, dpi=dpi)
+    return out_file
+
+
+def _draw_heatmap(fig, ax, cache, panel, fmt, cbar_label):
+    # 第一次创建图像、色条和注释文本，之后只更新数值、颜色范围、文本和刻度标签
+    data = np.asarray(panel['data'], dtype=np.float64)
+    finite = np.abs(data[np.isfinite(data)])
+    lim = finite.max() if len(finite) and finite.max() > 0 else 1.0
+    if 'image' not in cache:
+        cache['image'] = ax.imshow(data, cmap='RdYlGn', aspect='auto', vmin=-lim, vmax=lim, interpolation='nearest')
+        fig.colorbar(cache['image'], ax=ax, label=cbar_label)
+        cache['texts'] = [[ax.text(j, i, '', ha='center', va='center', fontsize=8) for j in range(data.shape[1])]
+                          for i in range(data.shape[0])]
+        ax.set_xticks(range(data.shape[1]))
+        ax.set_yticks(range(data.shape[0]))
+    cache['image'].set_data(np.ma.masked_invalid(data))
+    cache['image'].set_clim(-lim, lim)
+    for i, row in enumerate(cache['texts']):
+        for j, text in enumerate(row):
+            text.set_text(format(data[i, j], fmt) if np.isfinite(data[i, j]) else '')
+    ax.set_xticklabels([f'{v:g}' if isinstance(v, (int, float, np.number)) else str(v) for v in panel['columns']])
+    ax.set_yticklabels([f'{v:g}' if isinstance(v, (int, float, np.number)) else str(v) for v in panel['index']])
+    ax.set_title(panel.get('title', ''), fontsize=12, fontweight='bold')
+    ax.set_xlabel(panel.get('xlabel', ''), fontsize=10)
+    ax.set_ylabel(panel.get('ylabel', ''), fontsize=10)
+
+
+def render_heatmaps(out_file, panels, n_cols=None, suptitle='', panel_size=(6, 5), fmt='.2f',
+                    cbar_label='Sharpe Ratio', dpi=150):
+    """
+    一张图中画多个带注释的热力图（panels 为 dict(data, index, columns, title, xlabel, ylabel) 列表）
+    相同布局和形状的图复用同一个 figure
+    """
+    plt = _pyplot()
+    n_plots = len(panels)
+    n_cols = n_cols or int(np.ceil(np.sqrt(n_plots)))
+    n_rows = int(np.ceil(n_plots / n_cols))
+    key = ('heatmaps', n_rows, n_cols, panel_size, tuple(np.shape(p['data']) for p in panels))
+    if key not in _figures:
+        fig, axes = plt.subplots(n_rows, n_cols, figsize=(panel_size[0] * n_cols, panel_size[1] * n_rows), squeeze=False)
+        axes = axes.flatten()
+        for ax in axes[n_plots:]:
+            ax.set_visible(False)
+        _figures[key] = (fig, axes, [{} for _ in range(n_plots)])
+    fig, axes, caches = _figures[key]
+    for ax, cache, panel in zip(axes, caches, panels):
+        _draw_heatmap(fig, ax, cache, panel, fmt, cbar_label)
+    if suptitle:
+        fig.suptitle(suptitle, fontsize=16, fontweight='bold', y=0.995)
+    fig.tight_layout()
+    fig.savefig(out_file, dpi=dpi, bbox_inches='tight')
+    return out_file
+
+
+RENDERERS = {
+    'cpnl': render_cpnl,
+    'heatmaps': render_heatmaps,
+}
+
+
+def _render(job):
+    kind, kwargs = job
+    return RENDERERS[kind](**kwargs)
+
+
+def heatmap_panel(pivot, title='', xlabel='', ylabel=''):
+    """
+    由 DataFrame.pivot 的结果构造一个热力图面板
+    """
+    return {
+        'data': pivot.to_numpy(dtype=np.float64),
+        'index': list(pivot.index),
+        'columns': list(pivot.columns),
+        'title': title,
+        'xlabel': xlabel,
+        'ylabel': ylabel,
+    }
+
+
+class PlotRenderer:
+    """
+    绘图任务队列：cpnl() / heatmaps() 立即返回，图在渲染进程中生成
+    close()（或 with 块结束）时等待所有任务完成，出错的任务只打印错误
+    """
+
+    def __init__(self, workers=RENDER_WORKERS):
+        self.workers = workers
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) if workers else None
+        self.futures = []
+
+    def submit(self, kind, **kwargs):
+        if self.executor is None:
+            self.futures.append((kwargs['out_file'], _render((kind, kwargs)), None))
+        else:
+            self.futures.append((kwargs['out_file'], None, self.executor.submit(_render, (kind, kwargs))))
+
+    def cpnl(self, out_file, cpnl, open_time=None, title='', dpi=150):
+        self.submit('cpnl', out_file=out_file, cpnl=np.asarray(cpnl),
+                    open_time=None if open_time is None else np.asarray(open_time), title=title, dpi=dpi)
+
+    def heatmaps(self, out_file, panels, n_cols=None, suptitle='', panel_size=(6, 5), fmt='.2f',
+                 cbar_label='Sharpe Ratio', dpi=150):
+        self.submit('heatmaps', out_file=out_file, panels=panels, n_cols=n_cols, suptitle=suptitle,
+                    panel_size=panel_size, fmt=fmt, cbar_label=cbar_label, dpi=dpi)
+
+    def close(self):
+        """
+        等待所有绘图任务完成，返回成功生成的文件列表
+        """
+        files = []
+        for out_file, result, future in self.futures:
+            try:
+                files.append(result if future is None else future.result())
+            except Exception as e:
+                print(f"  绘图错误: {os.path.basename(out_file)}: {e}")
+        self.futures = []
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        return files
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
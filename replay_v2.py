@@ -0,0 +1,164 @@
+import csv
+import json
+import time
+import numpy as np
+from kline_cache import load_columns
+from position_engine import hysteresis_positions
+from streaming_signal import StreamingSignal
+from sweep_engine import rolling_zscore
+
+# 逐根K线回放：把 klineData.csv（或列式缓存）一根一根喂给 V2 的增量信号（streaming_signal），
+# 模拟实盘行情推送，记录每根K线的处理延迟和整体吞吐量，持仓变化作为事件输出
+# 可作为实盘路径的性能回归基准
+CSV_FILE = 'klineData.csv'
+SOURCE = 'csv'            # 'csv'：逐行读取 CSV；'cache'：读取列式缓存（见 kline_cache）
+M = 20
+Z_OPEN = 1.0
+Z_CLOSE = 0.3
+RATE = None               # 每秒回放的K线数，None 表示全速
+EVENTS_FILE = None        # 持仓变化事件输出文件（csv），None 表示不输出
+REPORT_FILE = None        # 延迟 / 吞吐量报告输出文件（json），None 表示不输出
+CHUNK_ROWS = 65536        # 读取列式缓存时每次转换的行数
+CHECK_OFFLINE = True      # 回放后用批量计算（rolling_zscore + hysteresis_positions）核对持仓变化事件
+
+
+def iter_csv_bars(csv_file):
+    """
+    逐行读取 CSV，产出 (open_time, close)，不把整个文件读进内存
+    """
+    with open(csv_file, 'r', newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        time_col, close_col = header.index('open_time'), header.index('close')
+        for row in reader:
+            yield int(row[time_col]), float(row[close_col])
+
+
+def iter_cache_bars(csv_file, chunk_rows=CHUNK_ROWS):
+    """
+    从列式缓存逐根产出 (open_time, close)（缓存不存在或过期时先生成），
+    每次只把 chunk_rows 行从 memmap 转成 Python 数值，内存占用与数据长度无关
+    """
+    cols = load_columns(csv_file, ['open_time', 'close'])
+    open_time, close = cols['open_time'], cols['close']
+    for start in range(0, len(close), chunk_rows):
+        end = start + chunk_rows
+        yield from zip(open_time[start:end].tolist(), close[start:end].tolist())
+
+
+def latency_summary(latency_ns):
+    """
+    每根K线处理延迟的 p50 / p99 / max（微秒）和按 2 的幂分桶的直方图
+    """
+    lat = np.asarray(latency_ns, dtype=np.int64)
+    if len(lat) == 0:
+        return {'p50_us': 0.0, 'p99_us': 0.0, 'max_us': 0.0, 'histogram_us': {}}
+    p50, p99 = np.percentile(lat, [50, 99])
+    # 分桶上界：1, 2, 4, 8 ... 微秒
+    buckets = np.ceil(np.log2(np.maximum(lat / 1000.0, 1.0))).astype(np.int64)
+    counts = np.bincount(buckets)
+    return {
+        'p50_us': p50 / 1000.0,
+        'p99_us': p99 / 1000.0,
+        'max_us': lat.max() / 1000.0,
+        'histogram_us': {f'<={2 ** b}': int(c) for b, c in enumerate(counts) if c},
+    }
+
+
+def replay(bars, M=M, z_open=Z_OPEN, z_close=Z_CLOSE, rate=RATE, on_event=None):
+    """
+    回放 bars（(open_time, close) 的迭代器），返回 (事件列表, 报告)
+    - rate：每秒K线数，按墙钟时间等待到每根K线的计划时间再处理；None 为全速
+    - on_event：每个持仓变化事件的回调，事件为 dict(bar, open_time, close, zscore, from_position, to_position)
+    延迟只统计策略更新本身（不含读取数据和等待）
+    """
+    stream = StreamingSignal('V2', M, z_open, z_close=z_close)
+    events = []
+    latency_ns = []
+    interval = 1.0 / rate if rate else 0.0
+    clock = time.perf_counter_ns
+    start = time.perf_counter()
+    for i, (open_time, close) in enumerate(bars):
+        if rate:
+            delay = start + i * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        last_position = stream.position
+        t0 = clock()
+        position = stream.update(close)
+        latency_ns.append(clock() - t0)
+        if position != last_position:
+            event = {
+                'bar': i,
+                'open_time': open_time,
+                'close': close,
+                'zscore': stream.zscore,
+                'from_position': last_position,
+                'to_position': position,
+            }
+            events.append(event)
+            if on_event is not None:
+                on_event(event)
+    elapsed = time.perf_counter() - start
+
+    report = {
+        'bars': len(latency_ns),
+        'events': len(events),
+        'seconds': elapsed,
+        'bars_per_second': len(latency_ns) / elapsed if elapsed > 0 else 0.0,
+        'final_cpnl': stream.cpnl,
+    }
+    report.update(latency_summary(latency_ns))
+    return events, report
+
+
+def offline_check(csv_file, events, M=M, z_open=Z_OPEN, z_close=Z_CLOSE):
+    """
+    用离线策略的批量计算核对回放的持仓变化事件，返回 {'offline_events', 'event_mismatches', 'first_mismatch_bar'}
+    event_mismatches 为只在一边出现、或变化后持仓不同的K线数，为 0 时回放与离线策略的持仓完全一致
+    """
+    close = load_columns(csv_file, ['close'])['close']
+    position = hysteresis_positions(rolling_zscore(close, M), M, z_open, z_close)[0]
+    changes = np.flatnonzero(np.diff(position, prepend=0))
+    offline = dict(zip(changes.tolist(), position[changes].tolist()))
+    replayed = {e['bar']: e['to_position'] for e in events}
+    mismatches = sorted(bar for bar in offline.keys() | replayed.keys() if offline.get(bar) != replayed.get(bar))
+    return {
+        'offline_events': len(offline),
+        'event_mismatches': len(mismatches),
+        'first_mismatch_bar': mismatches[0] if mismatches else None,
+    }
+
+
+def run_replay(csv_file=CSV_FILE, source=SOURCE, M=M, z_open=Z_OPEN, z_close=Z_CLOSE, rate=RATE,
+               events_file=EVENTS_FILE, report_file=REPORT_FILE, on_event=None, check_offline=CHECK_OFFLINE):
+    if source == 'csv':
+        bars = iter_csv_bars(csv_file)
+    elif source == 'cache':
+        bars = iter_cache_bars(csv_file)
+    else:
+        raise ValueError(f'unknown source: {source}')
+    events, report = replay(bars, M, z_open, z_close, rate, on_event)
+    report.update({'csv_file': csv_file, 'source': source, 'M': M, 'z_open': z_open, 'z_close': z_close, 'rate': rate})
+
+    print(f"回放 {report['bars']} 根K线，{report['events']} 次持仓变化，用时 {report['seconds']:.2f} 秒"
+          f"（{report['bars_per_second']:.0f} 根/秒）")
+    print(f"每根K线延迟：p50 {report['p50_us']:.2f} 微秒，p99 {report['p99_us']:.2f} 微秒，max {report['max_us']:.2f} 微秒")
+    if check_offline:
+        report.update(offline_check(csv_file, events, M, z_open, z_close))
+        print(f"离线策略 {report['offline_events']} 次持仓变化，与回放不一致 {report['event_mismatches']} 根K线")
+    if events_file:
+        with open(events_file, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=['bar', 'open_time', 'close', 'zscore', 'from_position', 'to_position'])
+            writer.writeheader()
+            writer.writerows(events)
+        print(f"事件已保存到: {events_file}")
+    if report_file:
+        with open(report_file, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"报告已保存到: {report_file}")
+    return events, report
+
+
+if __name__ == "__main__":
+    run_replay()
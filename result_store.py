@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import sqlite3
+import pandas as pd
+from kline_cache import cache_dir, source_fingerprint
+
+# 参数遍历结果库（SQLite）：每行以 (数据文件内容哈希, 策略, 策略版本, M, a, b) 为键
+# 重复遍历时只计算库里没有的组合，每个任务块完成后立即写入，中断后重跑会从断点继续
+# 策略计算逻辑变化时把对应版本号加一，旧结果不再被命中
+STORE_FILE = 'kline/results.sqlite'
+STRATEGY_VERSIONS = {'V1': 3, 'V2': 3}
+# 每个策略的 (a, b) 参数名，与 parallel_sweep.run_sweep 的 values_a / values_b 对应
+PARAM_COLUMNS = {'V1': ('N', 'z_open'), 'V2': ('z_open', 'z_close')}
+# 单独建列、可以用来排序和过滤的指标，完整的汇总行以 JSON 保存在 row 列
+METRIC_COLUMNS = ['final_cpnl', 'sharpe_ratio', 'hp', 'total_signals', 'max_position']
+HASH_CHUNK = 1 << 20
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime_ns INTEGER,
+    sha256 TEXT
+);
+CREATE TABLE IF NOT EXISTS results (
+    data_hash TEXT,
+    strategy TEXT,
+    version INTEGER,
+    M REAL,
+    a REAL,
+    b REAL,
+    {', '.join(f'{c} REAL' for c in METRIC_COLUMNS)},
+    row TEXT,
+    PRIMARY KEY (data_hash, strategy, version, M, a, b)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS results_sharpe ON results (data_hash, strategy, version, sharpe_ratio);
+CREATE INDEX IF NOT EXISTS results_cpnl ON results (data_hash, strategy, version, final_cpnl);
+"""
+
+
+def file_sha256(*paths):
+    h = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_CHUNK), b''):
+                h.update(block)
+    return h.hexdigest()
+
+
+def data_files(csv_file):
+    """
+    数据对应的文件：CSV 存在时为 CSV，只有列式缓存时（见 kline_cache.ensure_cache）为缓存目录中的所有文件
+    """
+    if os.path.exists(csv_file):
+        return [csv_file]
+    path = cache_dir(csv_file)
+    return [os.path.join(path, name) for name in sorted(os.listdir(path))]
+
+
+def _plain(value):
+    # numpy 标量转成 Python 数值，JSON 和 SQLite 才能保存
+    return value.item() if hasattr(value, 'item') else value
+
+
+class ResultStore:
+    """
+    参数遍历结果库
+    - data_hash(csv_file)：数据文件内容哈希（按 大小 + 修改时间 缓存，文件不变时不重新计算）；
+      没有CSV、只有列式缓存时对缓存目录中的文件计算
+    - lookup / append：按参数组合读取 / 写入汇总行
+    - query / top_k：按 M、参数范围过滤，按指标排序
+    """
+
+    def __init__(self, path=STORE_FILE):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def data_hash(self, csv_file):
+        files = data_files(csv_file)
+        fps = [source_fingerprint(f) for f in files]
+        fp = {'path': os.path.abspath(csv_file), 'size': sum(f['size'] for f in fps),
+              'mtime_ns': max(f['mtime_ns'] for f in fps)}
+        row = self.conn.execute('SELECT size, mtime_ns, sha256 FROM files WHERE path = ?', (fp['path'],)).fetchone()
+        if row is not None and row[0] == fp['size'] and row[1] == fp['mtime_ns']:
+            return row[2]
+        sha256 = file_sha256(*files)
+        with self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)',
+                              (fp['path'], fp['size'], fp['mtime_ns'], sha256))
+        return sha256
+
+    def lookup(self, data_hash, strategy, M_values=None):
+        """
+        返回 {(M, a, b): 汇总行}，M_values 不为空时只读取这些 M
+        """
+        sql = 'SELECT M, a, b, row FROM results WHERE data_hash = ? AND strategy = ? AND version = ?'
+        args = [data_hash, strategy, STRATEGY_VERSIONS[strategy]]
+        if M_values is not None:
+            sql += f" AND M IN ({', '.join('?' * len(M_values))})"
+            args.extend(M_values)
+        return {(M, a, b): json.loads(row) for M, a, b, row in self.conn.execute(sql, args)}
+
+    def append(self, data_hash, strategy, rows):
+        """
+        写入一批汇总行（已存在的组合覆盖），一批一个事务
+        """
+        name_a, name_b = PARAM_COLUMNS[strategy]
+        version = STRATEGY_VERSIONS[strategy]
+        records = []
+        for r in rows:
+            r = {k: _plain(v) for k, v in r.items()}
+            records.append((data_hash, strategy, version, r['M'], r[name_a], r[name_b],
+                            *(r.get(c) for c in METRIC_COLUMNS), json.dumps(r)))
+        placeholders = ', '.join('?' * (7 + len(METRIC_COLUMNS)))
+        with self.conn:
+            self.conn.executemany(f'INSERT OR REPLACE INTO results VALUES ({placeholders})', records)
+
+    def query(self, data_hash, strategy, M=None, where=None, order_by=None, ascending=False, limit=None):
+        """
+        读取汇总行为 DataFrame
+        - M：单个值或列表
+        - where：{列名: 值 或 (下限, 上限)}，列名为参数名（如 'z_open'）或 METRIC_COLUMNS 中的指标
+        - order_by：METRIC_COLUMNS 中的指标，NaN 排在最后
+        """
+        columns = {'M': 'M', PARAM_COLUMNS[strategy][0]: 'a', PARAM_COLUMNS[strategy][1]: 'b'}
+        columns.update({c: c for c in METRIC_COLUMNS})
+        sql = 'SELECT row FROM results WHERE data_hash = ? AND strategy = ? AND version = ?'
+        args = [data_hash, strategy, STRATEGY_VERSIONS[strategy]]
+        conditions = dict(where or {})
+        if M is not None:
+            conditions['M'] = M
+        for name, value in conditions.items():
+            if name not in columns:
+                raise ValueError(f'unknown column: {name}')
+            if isinstance(value, tuple):
+                sql += f' AND {columns[name]} BETWEEN ? AND ?'
+                args.extend(value)
+            elif isinstance(value, (list, set)):
+                sql += f" AND {columns[name]} IN ({', '.join('?' * len(value))})"
+                args.extend(value)
+            else:
+                sql += f' AND {columns[name]} = ?'
+                args.append(value)
+        if order_by is not None:
+            if order_by not in METRIC_COLUMNS:
+                raise ValueError(f'order_by must be one of {METRIC_COLUMNS}, got {order_by}')
+            sql += f" ORDER BY {order_by} IS NULL, {order_by} {'ASC' if ascending else 'DESC'}"
+        if limit is not None:
+            sql += ' LIMIT ?'
+            args.append(int(limit))
+        return pd.DataFrame([json.loads(row) for row, in self.conn.execute(sql, args)])
+
+    def top_k(self, data_hash, strategy, metric='sharpe_ratio', k=10, M=None):
+        return self.query(data_hash, strategy, M=M, order_by=metric, limit=k)
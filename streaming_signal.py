@@ -0,0 +1,255 @@
+import math
+from sweep_engine import ZSCORE_EPS
+
+# 实盘用的增量信号：每来一根K线 O(1) 更新 rolling z-score、开仓信号和持仓，
+# 与 moving_average_strategy_V1 / V2 的批量计算在浮点误差范围内一致；平坦窗口（NaN）和 close 恰好等于窗口均值（0）
+# 两种情况按同一规则处理（见 sweep_engine.settle_zscore），只有 z_score 落在 z_open / z_close 附近的舍入误差内时信号才会不同
+# snapshot() 返回可 json 序列化的状态，restore() 从状态恢复（例如进程重启后继续）
+RESYNC_BARS = None   # 每多少根K线用窗口内数据重新精确计算一次均值和方差，None 表示每 M 根
+
+
+class RollingZScore:
+    """
+    固定窗口 M 的滚动均值 / 样本方差（ddof=1），窗口满之前逐个加入，之后每根K线用新值替换最旧的值：
+        mean' = mean + (x_new - x_old) / M
+        m2'   = m2 + (x_new - x_old) * (x_new - mean' + x_old - mean)
+    增量更新的误差会累积，每 resync 根K线用窗口内数据（math.fsum）重算一次，均摊仍是 O(1)
+    窗口内的值全部相同时（用连续相同收盘价的个数 run 判断）均值取该值、m2 严格为 0，z_score 为 NaN，
+    与批量计算（pandas rolling）一致；否则增量的 m2 会残留很小的非零值，返回 0 或 ±1e-7 量级的 z_score
+    |z_score| < ZSCORE_EPS 时返回 0，规则与批量计算相同（见 sweep_engine.settle_zscore）
+    """
+
+    def __init__(self, M, resync=RESYNC_BARS):
+        if M < 2:
+            raise ValueError('M must be >= 2')
+        self.M = M
+        self.resync = resync or M
+        self.window = [0.0] * M
+        self.head = 0          # 最旧值的位置
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.since_resync = 0
+        self.run = 0           # 以最新值结尾的连续相同值个数
+
+    def _recompute(self):
+        values = self.window if self.count >= self.M else self.window[:self.count]
+        self.mean = math.fsum(values) / len(values)
+        self.m2 = math.fsum((v - self.mean) ** 2 for v in values)
+        self.since_resync = 0
+
+    def _trailing_run(self):
+        # 由窗口内容计算 run（旧版本的 snapshot 没有保存 run）
+        values = [self.window[(self.head + i) % self.M] for i in range(self.count)]
+        run = 0
+        while run < len(values) and values[-1 - run] == values[-1]:
+            run += 1
+        return run
+
+    def update(self, x):
+        """
+        加入一个收盘价，返回 z_score；窗口未满或标准差为 0 时返回 NaN
+        """
+        x = float(x)
+        if self.count and x == self.window[(self.head + self.count - 1) % self.M]:
+            self.run += 1
+        else:
+            self.run = 1
+        if self.count < self.M:
+            # 窗口未满：Welford 逐个加入
+            self.window[self.count] = x
+            self.count += 1
+            delta = x - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (x - self.mean)
+        else:
+            old = self.window[self.head]
+            self.window[self.head] = x
+            self.head = (self.head + 1) % self.M
+            old_mean = self.mean
+            self.mean += (x - old) / self.M
+            self.m2 += (x - old) * (x - self.mean + old - old_mean)
+            self.since_resync += 1
+            if self.since_resync >= self.resync:
+                self._recompute()
+        if self.count < self.M:
+            return math.nan
+        if self.run >= self.M:
+            # 平坦窗口：丢弃增量误差，标准差为 0
+            self.mean = x
+            self.m2 = 0.0
+            return math.nan
+        var = self.m2 / (self.M - 1)
+        if var <= 0:
+            return math.nan
+        z = (x - self.mean) / math.sqrt(var)
+        return 0.0 if abs(z) < ZSCORE_EPS else z
+
+    def snapshot(self):
+        return {
+            'M': self.M,
+            'resync': self.resync,
+            'window': list(self.window),
+            'head': self.head,
+            'count': self.count,
+            'mean': self.mean,
+            'm2': self.m2,
+            'since_resync': self.since_resync,
+            'run': self.run,
+        }
+
+    @classmethod
+    def restore(cls, state):
+        obj = cls(state['M'], state['resync'])
+        obj.window = [float(v) for v in state['window']]
+        for key in ['head', 'count', 'since_resync']:
+            setattr(obj, key, int(state[key]))
+        obj.mean = float(state['mean'])
+        obj.m2 = float(state['m2'])
+        obj.run = int(state['run']) if 'run' in state else obj._trailing_run()
+        return obj
+
+
+
+class StreamingSignal:
+    """
+    单品种增量信号
+    - strategy='V1'：position = 最近 N 根K线 open_signal 之和
+    - strategy='V2'：z_open 开仓、z_close 平仓的状态机
+    update(close) 返回当前持仓，同时更新 zscore / open_signal / position / pnl / cpnl 属性
+    前 M 根K线的 open_signal 为 0，与批量计算一致
+    """
+
+    def __init__(self, strategy, M, z_open, N=None, z_close=None, resync=RESYNC_BARS):
+        if strategy == 'V1' and N is None:
+            raise ValueError('V1 needs N')
+        if strategy == 'V2' and z_close is None:
+            raise ValueError('V2 needs z_close')
+        if strategy not in ('V1', 'V2'):
+            raise ValueError(f'unknown strategy: {strategy}')
+        self.strategy = strategy
+        self.M = M
+        self.N = N
+        self.z_open = z_open
+        self.z_close = z_close
+        self.zscorer = RollingZScore(M, resync)
+        self.bars = 0
+        self.zscore = math.nan
+        self.open_signal = 0
+        self.position = 0
+        self.last_close = None
+        self.pnl = 0.0
+        self.cpnl = 0.0
+        # V1：最近 N 个 open_signal 的环形缓冲区和它们的和
+        self.signals = [0] * N if strategy == 'V1' else None
+        self.signal_sum = 0
+
+    def update(self, close):
+        close = float(close)
+        z = self.zscorer.update(close)
+        # pnl = return * last_position
+        self.pnl = (close / self.last_close - 1) * self.position if self.last_close is not None else 0.0
+        self.cpnl += self.pnl
+        self.last_close = close
+
+        # NaN 比较结果都为 False，与批量计算的 np.where 一致
+        if self.bars < self.M:
+            signal = 0
+        elif z > self.z_open:
+            signal = 1
+        elif z < -self.z_open:
+            signal = -1
+        else:
+            signal = 0
+
+        if self.strategy == 'V1':
+            slot = self.bars % self.N
+            self.signal_sum += signal - self.signals[slot]
+            self.signals[slot] = signal
+            position = self.signal_sum
+        else:
+            position = self.position
+            if position == 1 and 0 < z < self.z_close:
+                position = 0
+            elif position == -1 and -self.z_close < z < 0:
+                position = 0
+            if position == 0 and signal != 0:
+                position = signal
+
+        self.bars += 1
+        self.zscore = z
+        self.open_signal = signal
+        self.position = position
+        return position
+
+    def snapshot(self):
+        return {
+            'strategy': self.strategy,
+            'M': self.M,
+            'N': self.N,
+            'z_open': self.z_open,
+            'z_close': self.z_close,
+            'zscorer': self.zscorer.snapshot(),
+            'bars': self.bars,
+            'zscore': self.zscore,
+            'open_signal': self.open_signal,
+            'position': self.position,
+            'last_close': self.last_close,
+            'pnl': self.pnl,
+            'cpnl': self.cpnl,
+            'signals': list(self.signals) if self.signals is not None else None,
+            'signal_sum': self.signal_sum,
+        }
+
+    @classmethod
+    def restore(cls, state):
+        obj = cls(state['strategy'], state['M'], state['z_open'], state['N'], state['z_close'])
+        obj.zscorer = RollingZScore.restore(state['zscorer'])
+        for key in ['bars', 'zscore', 'open_signal', 'position', 'last_close', 'pnl', 'cpnl', 'signal_sum']:
+            setattr(obj, key, state[key])
+        if state['signals'] is not None:
+            obj.signals = list(state['signals'])
+        return obj
+
+
+if __name__ == "__main__":
+    import time
+    import numpy as np
+    from kline_cache import load_columns
+    from sweep_engine import rolling_zscore
+    from position_engine import hysteresis_positions
+
+    close = load_columns('klineData.csv', ['close'])['close']
+    M, z_open, z_close = 20, 1.0, 0.3
+    stream = StreamingSignal('V2', M, z_open, z_close=z_close)
+    zscores, positions = [], []
+    start = time.perf_counter()
+    for price in close:
+        positions.append(stream.update(price))
+        zscores.append(stream.zscore)
+    elapsed = time.perf_counter() - start
+
+    batch_z = rolling_zscore(close, M)
+    batch_position = hysteresis_positions(batch_z, M, z_open, z_close)[0]
+    max_err = max((abs(a - b) for a, b in zip(zscores, batch_z) if not math.isnan(b)), default=0.0)
+    mismatch = sum(int(a != b) for a, b in zip(positions, batch_position))
+    print(f"{len(close)} 根K线，每根 {elapsed / len(close) * 1e6:.2f} 微秒")
+    print(f"z_score 最大误差 {max_err:.3g}，持仓不一致 {mismatch} 根")
+
+    # 回归用例：带平坦区间（连续多根收盘价不变，流动性差的品种在 1s / 1m K线上很常见）的随机游走，
+    # 平坦窗口的 z_score 两边都必须是 NaN
+    nan_mismatch = 0
+    for seed in range(50):
+        rng = np.random.default_rng(seed)
+        walk_M = int(rng.integers(5, 60))
+        walk = np.round(100 + np.cumsum(rng.normal(0, 0.5, 400)), 2)
+        flat_start = int(rng.integers(50, 300))
+        walk[flat_start:flat_start + int(rng.integers(walk_M, 3 * walk_M))] = walk[flat_start]
+        stream = StreamingSignal('V2', walk_M, z_open, z_close=z_close)
+        zscores = []
+        for price in walk:
+            stream.update(price)
+            zscores.append(stream.zscore)
+        nan_mismatch += int(not np.array_equal(np.isnan(zscores), np.isnan(rolling_zscore(walk, walk_M))))
+    print(f"平坦区间回归用例：50 组随机游走中 NaN 位置不一致 {nan_mismatch} 组")
+    assert nan_mismatch == 0
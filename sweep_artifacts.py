@@ -0,0 +1,41 @@
+# 参数遍历只在内存中计算汇总指标，排序后只为选中的组合生成明细CSV和PNL图
+# 每个策略可用于排序的指标（V1 的汇总行没有 hp）
+ARTIFACT_METRICS = {'V1': ['final_cpnl', 'sharpe_ratio'], 'V2': ['final_cpnl', 'sharpe_ratio', 'hp']}
+
+
+def check_metric(strategy, metric):
+    """
+    参数遍历开始前检查排序指标，避免遍历结束后才在 select_combos 中报错
+    """
+    if metric not in ARTIFACT_METRICS[strategy]:
+        raise ValueError(f'{strategy} metric must be one of {ARTIFACT_METRICS[strategy]}, got {metric}')
+
+
+def select_combos(summary_df, param_columns, metric='final_cpnl', top_k=10, ascending=False, combos=None):
+    """
+    选出需要生成明细的参数组合
+    - combos 不为空时直接使用这份明确的参数列表（如 [{'M': 20, 'N': 32, 'z_open': 1.2}]）
+    - 否则按 metric 排序取前 top_k 个（默认从大到小，NaN 排在最后）
+    """
+    if combos is not None:
+        return [dict(c) for c in combos]
+    if metric not in summary_df.columns:
+        raise ValueError(f'metric {metric} is not a summary column: {list(summary_df.columns)}')
+    if len(summary_df) == 0 or not top_k:
+        return []
+    ranked = summary_df.sort_values(metric, ascending=ascending, kind='mergesort').head(top_k)
+    return ranked[param_columns].to_dict('records')
+
+
+def emit_artifacts(strategy_func, csv_file, combos, renderer=None):
+    """
+    逐个运行 strategy_func(csv_file, **params) 生成明细CSV和PNL图，单个组合出错不影响其余组合
+    renderer 不为空时PNL图交给渲染进程生成（见 render.PlotRenderer）
+    """
+    extra = {'renderer': renderer} if renderer is not None else {}
+    for params in combos:
+        print(f"\n生成明细: {params}")
+        try:
+            strategy_func(csv_file, **params, **extra)
+        except Exception as e:
+            print(f"  错误: {e}")
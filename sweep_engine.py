@@ -0,0 +1,259 @@
+import numpy as np
+import pandas as pd
+from position_engine import open_signals, hysteresis_positions, position_pnl
+from kline_cache import load_columns
+from metrics import bar_interval_ms
+
+# 资金费率结算周期（成本网格中 funding_bps 的计价周期）
+FUNDING_INTERVAL_MS = 8 * 60 * 60 * 1000
+# |z_score| 小于该值时视为 0（见 settle_zscore）
+ZSCORE_EPS = 1e-9
+
+
+def flat_windows(close, M):
+    """
+    以每个位置结尾的 M 个值全部相同的位置（前 M-1 个为 False），由相邻相等的个数的前缀和 O(n) 得到
+    pandas 的 rolling std 在这种窗口上取决于之前的滚动累加历史，有时为 0（z_score 为 NaN），
+    有时残留 1e-7 量级的误差（z_score 为 0 或很小的值），因此这些位置的 z_score 统一置为 NaN（见 settle_zscore）
+    """
+    close = np.asarray(close, dtype=np.float64)
+    flat = np.zeros(len(close), dtype=bool)
+    if M < 2 or len(close) < M:
+        return flat
+    same = np.concatenate([[0], np.cumsum(close[1:] == close[:-1])])
+    flat[M - 1:] = same[M - 1:] - same[:len(close) - M + 1] == M - 1
+    return flat
+
+
+def settle_zscore(zscore, close, M):
+    """
+    批量计算和增量计算（streaming_signal）共用的 z_score 收尾规则，close 为 (n,) 或 (n, 品种数)：
+    - 窗口内收盘价全部相同的位置为 NaN（见 flat_windows）
+    - |z_score| < ZSCORE_EPS 时为 0：close 恰好等于窗口均值（按最小价格变动取值的K线上很常见）时 z_score 理论上为 0，
+      两边的舍入误差（1e-13 量级）符号可能相反，V2 的平仓判断（0 < z < z_close）会因此不同
+    """
+    zscore = np.asarray(zscore, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+    if close.ndim == 1:
+        flat = flat_windows(close, M)
+    else:
+        flat = np.column_stack([flat_windows(close[:, j], M) for j in range(close.shape[1])])
+    with np.errstate(invalid='ignore'):
+        tiny = np.abs(zscore) < ZSCORE_EPS
+    return np.where(flat, np.nan, np.where(tiny, 0.0, zscore))
+
+
+def rolling_zscore(close, M):
+    """
+    close 的 rolling z-score（观察期M），与策略函数中的 DataFrame 写法完全一致
+    """
+    close = pd.Series(np.asarray(close, dtype=np.float64), copy=False)
+    rolling_mean = close.rolling(window=M).mean()
+    rolling_std = close.rolling(window=M).std()
+    return settle_zscore(((close - rolling_mean) / rolling_std).to_numpy(), close.to_numpy(), M)
+
+
+def v1_positions(signal, N_values):
+    """
+    V1 持仓：position = signal 在 N 窗口内的滚动和（min_periods=1）
+    用 signal 的前缀和一次得到所有 N 的持仓，返回 (len(N_values), n) 的 float64 矩阵
+    """
+    signal = np.asarray(signal, dtype=np.int64)
+    n = len(signal)
+    csum = np.concatenate([[0], np.cumsum(signal)])
+    idx = np.arange(1, n + 1)
+    position = np.empty((len(N_values), n), dtype=np.float64)
+    for k, N in enumerate(N_values):
+        position[k] = csum[idx] - csum[np.maximum(idx - N, 0)]
+    return position
+
+
+def pnl_matrix(close, position):
+    """
+    pnl = return * last_position，position 为 (K, n)，第一行 pnl 为 0
+    """
+    close = np.asarray(close, dtype=np.float64)
+    ret = np.zeros(len(close), dtype=np.float64)
+    ret[1:] = close[1:] / close[:-1] - 1
+    pnl = np.zeros(position.shape, dtype=np.float64)
+    pnl[:, 1:] = ret[1:] * position[:, :-1]
+    return pnl
+
+
+def sharpe_ratios(pnl):
+    """
+    每一行 pnl 的 Sharpe Ratio = mean / std * 94，std 为样本标准差（ddof=1），与 Series.mean()/std() 结果一致
+    """
+    count = pnl.shape[1]
+    pnl_mean = pnl.sum(axis=1) / count
+    pnl_std = np.sqrt(((pnl_mean[:, None] - pnl) ** 2).sum(axis=1) / (count - 1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe = pnl_mean / pnl_std * 94
+    return np.where(pnl_std != 0, sharpe, 0)
+
+
+def cost_moments(pnl, position):
+    """
+    成本网格用的一阶 / 二阶矩：对每组参数的 [gross pnl, 换手 |position - last_position|, last_position]
+    返回 (mean (K, 3), cov (K, 3, 3), n)，之后任意成本水平的净值指标都只是这些矩的线性组合
+    """
+    position = np.asarray(position, dtype=np.float64)
+    K, n = pnl.shape
+    x = np.zeros((K, 3, n))
+    x[:, 0] = pnl
+    x[:, 1, 1:] = np.abs(np.diff(position, axis=1))
+    x[:, 2, 1:] = position[:, :-1]
+    mean = x.sum(axis=2) / n
+    x -= mean[:, :, None]
+    cov = np.einsum('kin,kjn->kij', x, x) / (n - 1)
+    return mean, cov, n
+
+
+def data_bar_ms(csv_file):
+    """
+    由数据的 open_time 列推断K线周期（毫秒，见 metrics.bar_interval_ms）
+    """
+    return bar_interval_ms(load_columns(csv_file, ['open_time'])['open_time'])
+
+
+def net_cost_metrics(mean, cov, n, cost_levels, bar_ms):
+    """
+    一次广播算出所有成本水平下的净值指标
+    cost_levels: [{'fee_bps': .., 'slippage_bps': .., 'funding_bps': ..}]，手续费和滑点按每边 bps 计，
+    funding_bps 为每 8 小时的资金费率（正值时多头付费、空头收费，可省略），按K线周期 bar_ms（毫秒）折算到每根K线
+    net pnl = pnl - (fee + slippage) * |position - last_position| - funding_per_bar * last_position
+    返回 {'net_final_cpnl', 'net_sharpe_ratio', 'cost'}，每个为 (K, L) 矩阵
+    net_sharpe_ratio 与同一行的 sharpe_ratio（见 sharpe_ratios）一样沿用固定的年化系数 94，不随 bar_ms 变化，
+    零成本时两者在浮点误差内相等；按实际K线周期年化见 metrics.annualization
+    """
+    w = np.array([[1.0,
+                   -(c.get('fee_bps', 0) + c.get('slippage_bps', 0)) / 1e4,
+                   -c.get('funding_bps', 0) / 1e4 * bar_ms / FUNDING_INTERVAL_MS] for c in cost_levels])
+    net_mean = mean @ w.T
+    net_var = np.einsum('li,kij,lj->kl', w, cov, w)
+    net_std = np.sqrt(np.maximum(net_var, 0))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe = np.where(net_std > 0, net_mean / net_std * 94, 0)
+    return {
+        'net_final_cpnl': net_mean * n,
+        'net_sharpe_ratio': sharpe,
+        'cost': (mean[:, 0:1] - net_mean) * n,
+    }
+
+
+def _with_costs(row, net, k, cost_levels):
+    # 第 k 组参数的汇总行按成本水平展开，追加成本参数和净值指标
+    expanded = []
+    for l, level in enumerate(cost_levels):
+        r = dict(row)
+        r['fee_bps'] = level.get('fee_bps', 0)
+        r['slippage_bps'] = level.get('slippage_bps', 0)
+        r['funding_bps'] = level.get('funding_bps', 0)
+        for key, values in net.items():
+            r[key] = values[k, l]
+        expanded.append(r)
+    return expanded
+
+
+def v1_sweep_M(close, M, N_values, z_open_values, cost_levels=None, bar_ms=None):
+    """
+    固定观察期M，计算所有 (N, z_open) 组合的汇总指标
+    z_score 只计算一次，每个 z_open 的所有 N 由 signal 前缀和一次得到
+    返回按 N、z_open 顺序排列的 strategy_summary 行
+    cost_levels 不为空时每组参数按成本水平展开成多行（见 net_cost_metrics），此时需要K线周期 bar_ms（毫秒）
+    """
+    if cost_levels and bar_ms is None:
+        raise ValueError('bar_ms is required with cost_levels')
+    close = np.asarray(close, dtype=np.float64)
+    zscore = rolling_zscore(close, M)
+    rows = {}
+    for z_open in z_open_values:
+        signal = open_signals(zscore, M, z_open)[0]
+        position = v1_positions(signal, N_values)
+        pnl = pnl_matrix(close, position)
+        final_cpnl = np.cumsum(pnl, axis=1)[:, -1]
+        sharpe = sharpe_ratios(pnl)
+        total_signals = int((signal != 0).sum())
+        max_position = np.abs(position).max(axis=1)
+        net = net_cost_metrics(*cost_moments(pnl, position), cost_levels, bar_ms) if cost_levels else None
+        for k, N in enumerate(N_values):
+            row = {
+                'M': M,
+                'N': N,
+                'z_open': z_open,
+                'final_cpnl': final_cpnl[k],
+                'sharpe_ratio': sharpe[k],
+                'total_signals': total_signals,
+                'max_position': max_position[k]
+            }
+            rows[(N, z_open)] = _with_costs(row, net, k, cost_levels) if cost_levels else [row]
+    return [r for N in N_values for z_open in z_open_values for r in rows[(N, z_open)]]
+
+
+def v2_sweep_M(close, M, param_pairs, cost_levels=None, bar_ms=None):
+    """
+    固定观察期M，一次计算所有 (z_open, z_close) 组合的汇总指标
+    返回按 param_pairs 顺序排列的 strategy_summary 行
+    cost_levels 不为空时每组参数按成本水平展开成多行（见 net_cost_metrics），此时需要K线周期 bar_ms（毫秒）
+    """
+    if cost_levels and bar_ms is None:
+        raise ValueError('bar_ms is required with cost_levels')
+    close = np.asarray(close, dtype=np.float64)
+    zscore = rolling_zscore(close, M)
+    z_open = np.array([p[0] for p in param_pairs], dtype=np.float64)
+    z_close = np.array([p[1] for p in param_pairs], dtype=np.float64)
+    signal = open_signals(zscore, M, z_open)
+    position = hysteresis_positions(zscore, M, z_open, z_close)
+    columns = position_pnl(close, position)
+    final_cpnl = columns['cpnl'][:, -1]
+    sharpe = sharpe_ratios(columns['pnl'])
+    # hp (holding period) = sum|gmv| / sum(turnover) * 2
+    sum_gmv = np.abs(columns['gmv']).sum(axis=1)
+    sum_turnover = columns['turnover'].sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        hp = np.where(sum_turnover != 0, sum_gmv / sum_turnover * 2, 0)
+    total_signals = (signal != 0).sum(axis=1)
+    max_position = np.abs(position).max(axis=1)
+    rows = []
+    for k, (zo, zc) in enumerate(param_pairs):
+        rows.append({
+            'M': M,
+            'z_open': zo,
+            'z_close': zc,
+            'final_cpnl': final_cpnl[k],
+            'sharpe_ratio': sharpe[k],
+            'hp': hp[k],
+            'total_signals': total_signals[k],
+            'max_position': max_position[k]
+        })
+    if cost_levels:
+        net = net_cost_metrics(*cost_moments(columns['pnl'], position), cost_levels, bar_ms)
+        rows = [r for k, row in enumerate(rows) for r in _with_costs(row, net, k, cost_levels)]
+    return rows
+
+
+def v1_sweep(csv_file, M_values, N_values, z_open_values, cost_levels=None):
+    """
+    V1 参数网格遍历：数据只读取一次，每个 M 只计算一次 z_score
+    返回与逐组合运行 moving_average_strategy 相同的 strategy_summary 行（按 M、N、z_open 顺序）
+    """
+    close = load_columns(csv_file, ['close'])['close']
+    bar_ms = data_bar_ms(csv_file) if cost_levels else None
+    results_summary = []
+    for M in M_values:
+        results_summary.extend(v1_sweep_M(close, M, N_values, z_open_values, cost_levels, bar_ms))
+    return results_summary
+
+
+def v2_sweep(csv_file, M_values, z_open_values, z_close_values, cost_levels=None):
+    """
+    V2 参数网格遍历：数据只读取一次，每个 M 只计算一次 z_score，所有 (z_open, z_close) 一次算出持仓
+    返回按 M、z_open、z_close 顺序排列的 strategy_summary 行
+    """
+    close = load_columns(csv_file, ['close'])['close']
+    param_pairs = [(z_open, z_close) for z_open in z_open_values for z_close in z_close_values]
+    bar_ms = data_bar_ms(csv_file) if cost_levels else None
+    results_summary = []
+    for M in M_values:
+        results_summary.extend(v2_sweep_M(close, M, param_pairs, cost_levels, bar_ms))
+    return results_summary
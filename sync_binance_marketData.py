@@ -0,0 +1,161 @@
+import datetime
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import download_binance_marketData as dl
+
+# 增量同步：本地 manifest 记录已校验的文件（文件名、大小、修改时间、SHA-256、来源URL、下载时间）
+# 已校验且大小、修改时间都不变的文件直接跳过（VERIFY=True 时重新计算 SHA-256 与 manifest 比对）；
+# 其余文件先取 .CHECKSUM（读取后删除），再校验本地文件，只有缺失或损坏的才重新下载
+# 每校验完一个文件就追加一行到 manifest，中途中断后再次运行会从断点继续
+MANIFEST_FILE = 'manifest.jsonl'
+CHECKSUM_SUFFIX = '.CHECKSUM'
+VERIFY = False
+
+
+def sha256_file(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_manifest(dest):
+    """
+    读取 manifest，同一个文件以最后一行记录为准
+    """
+    manifest = {}
+    path = os.path.join(dest, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return manifest
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # 中断时可能留下不完整的最后一行
+                continue
+            manifest[entry['file']] = entry
+    return manifest
+
+
+def append_manifest(dest, entry, lock):
+    with lock:
+        with open(os.path.join(dest, MANIFEST_FILE), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + '\n')
+
+
+def read_checksum(path):
+    # .CHECKSUM 文件格式：<sha256>  <文件名>
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read().split()[0].lower()
+
+
+def sync_file(pool, url, dest, fname, manifest, lock, retries=2, verify=VERIFY):
+    """
+    同步单个文件，返回状态：
+    - 'verified'：manifest 中已校验且大小、修改时间不变（verify=True 时 SHA-256 也一致），跳过
+    - 'checked'：本地已有文件，校验通过后写入 manifest
+    - 'downloaded'：新下载（或重新下载）并校验通过
+    - 'missing'：服务器上没有该文件 / .CHECKSUM
+    - 'corrupt'：多次下载后仍校验失败
+    - 'failed'：下载失败
+    """
+    dest_path = os.path.join(dest, fname)
+    entry = manifest.get(fname)
+    if entry and os.path.exists(dest_path):
+        st = os.stat(dest_path)
+        if st.st_size == entry['size'] and st.st_mtime_ns == entry.get('mtime_ns'):
+            if not verify or sha256_file(dest_path) == entry['sha256']:
+                return 'verified'
+
+    checksum_path = dest_path + CHECKSUM_SUFFIX
+    try:
+        status = dl.fetch(pool, url + CHECKSUM_SUFFIX, checksum_path)
+        if status != 'downloaded':
+            return status
+        expected = read_checksum(checksum_path)
+    finally:
+        if os.path.exists(checksum_path):
+            os.remove(checksum_path)
+
+    downloads = 0
+    while True:
+        if os.path.exists(dest_path) and sha256_file(dest_path) == expected:
+            st = os.stat(dest_path)
+            append_manifest(dest, {
+                'file': fname,
+                'size': st.st_size,
+                'mtime_ns': st.st_mtime_ns,
+                'sha256': expected,
+                'url': url,
+                'fetched_at': datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            }, lock)
+            return 'downloaded' if downloads else 'checked'
+        if downloads > retries:
+            return 'corrupt'
+        status = dl.fetch(pool, url, dest_path)
+        if status != 'downloaded':
+            return status
+        downloads += 1
+
+
+def sync_all(planned, dest, workers=dl.CONCURRENCY_PARAM, per_host=dl.PER_HOST_LIMIT, retries=2, verify=VERIFY):
+    """
+    并发同步 planned 中的 (date, url, fname)，返回与 planned 顺序一致的 (fname, status) 列表
+    verify=True 时对 manifest 中已校验的文件也重新计算 SHA-256
+    """
+    os.makedirs(dest, exist_ok=True)
+    manifest = load_manifest(dest)
+    pool = dl.ConnectionPool(per_host=per_host)
+    lock = threading.Lock()
+
+    statuses = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(sync_file, pool, url, dest, fname, manifest, lock, retries, verify): fname
+                   for d, url, fname in planned}
+        for future in as_completed(futures):
+            fname = futures[future]
+            try:
+                statuses[fname] = future.result()
+            except Exception:
+                statuses[fname] = 'failed'
+            if statuses[fname] != 'verified':
+                print(statuses[fname] + ':', fname)
+    return [(fname, statuses[fname]) for d, url, fname in planned]
+
+
+def main():
+    try:
+        start_date = dl.parse_yyyymmdd(dl.START_PARAM)
+        end_date = dl.parse_yyyymmdd(dl.END_PARAM) if dl.END_PARAM else datetime.date.today()
+    except ValueError as e:
+        print('Invalid START_PARAM / END_PARAM:', e, file=sys.stderr)
+        sys.exit(2)
+
+    planned = [(d,) + dl.build_url(dl.SYMBOL_PARAM, d) for d in dl.daterange(start_date, end_date)]
+    print(f'Syncing {len(planned)} files for {dl.SYMBOL_PARAM} from {start_date} to {end_date} into {dl.DEST_PARAM}')
+    start_time = time.perf_counter()
+    results = sync_all(planned, dl.DEST_PARAM)
+    counts = {}
+    for fname, status in results:
+        counts[status] = counts.get(status, 0) + 1
+    print(f'Summary ({time.perf_counter() - start_time:.1f}s):', ', '.join(f'{k}={v}' for k, v in sorted(counts.items())))
+    if counts.get('corrupt') or counts.get('failed'):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,51 +1,125 @@
+import csv
+import glob
+import heapq
+import io
 import os
 import zipfile
 import pandas as pd
-import glob
+from kline_cache import write_cache
 
 SOURCE_DIR = './marketData/klines'
 MERGED_CSV = os.path.join(SOURCE_DIR, 'merged_data.csv')
+CHUNK_ROWS = 100000
+
+KLINE_COLUMNS = ['open_time', 'open', 'high', 'low', 'close', 'volume', 'close_time',
+                 'quote_volume', 'count', 'taker_buy_volume', 'taker_buy_quote_volume', 'ignore']
+INT_COLUMNS = ['open_time', 'close_time', 'count', 'ignore']
+
+
+def _normalize_time(value):
+    # 新版现货数据的时间戳是微秒，统一转换为毫秒
+    t = int(value)
+    return t // 1000 if t >= 10 ** 15 else t
+
+
+def iter_zip_rows(zip_file):
+    """
+    直接从 zip 中流式读取 csv 行（不解压到临时文件，也不把整个 csv 读进内存）
+    兼容有表头 / 无表头两种格式，时间戳统一为毫秒
+    """
+    with zipfile.ZipFile(zip_file, 'r') as zip_ref:
+        for file_name in zip_ref.namelist():
+            if not file_name.endswith('.csv'):
+                continue
+            with zip_ref.open(file_name) as source:
+                reader = csv.reader(io.TextIOWrapper(source, encoding='utf-8', newline=''))
+                for row in reader:
+                    if not row or not row[0].strip().isdigit():
+                        # 表头或空行
+                        continue
+                    row[0] = _normalize_time(row[0])
+                    row[6] = _normalize_time(row[6])
+                    yield row
+
 
-def merge_csv_files(input_dir=SOURCE_DIR, output_file=MERGED_CSV):
+def merge_rows(zip_files):
+    """
+    对已按时间排序的每日文件做 k 路归并，按 open_time 排序并去重（重复时保留先出现的行）
+    先读每个文件的第一行确定起始时间，只有当文件的起始时间进入归并范围时才打开它，
+    每日文件互不重叠时同一时刻只打开一两个文件
+    """
+    pending = []
+    for order, zip_file in enumerate(zip_files):
+        first = next(iter_zip_rows(zip_file), None)
+        if first is not None:
+            pending.append((first[0], order, zip_file))
+    pending.sort()
+    pending.reverse()
+
+    heap = []
+    last_time = None
+    while heap or pending:
+        # 打开所有起始时间不晚于当前最小时间的文件
+        while pending and (not heap or pending[-1][0] <= heap[0][0]):
+            _, order, zip_file = pending.pop()
+            rows = iter_zip_rows(zip_file)
+            row = next(rows, None)
+            if row is not None:
+                heapq.heappush(heap, (row[0], order, row, rows))
+        open_time, order, row, rows = heapq.heappop(heap)
+        if open_time != last_time:
+            last_time = open_time
+            yield row
+        row = next(rows, None)
+        if row is not None:
+            heapq.heappush(heap, (row[0], order, row, rows))
+
+
+def _row_chunks(rows, chunk_rows=CHUNK_ROWS):
+    dtypes = {c: ('int64' if c in INT_COLUMNS else 'float64') for c in KLINE_COLUMNS}
+    chunk = []
+    for row in rows:
+        chunk.append(row[:len(KLINE_COLUMNS)])
+        if len(chunk) >= chunk_rows:
+            yield pd.DataFrame(chunk, columns=KLINE_COLUMNS).astype(dtypes)
+            chunk = []
+    if chunk:
+        yield pd.DataFrame(chunk, columns=KLINE_COLUMNS).astype(dtypes)
+
+
+def merge_csv_files(input_dir=SOURCE_DIR, output_file=MERGED_CSV, output_format='csv'):
+    """
+    把 input_dir 下所有 zip 中的 kline csv 合并成一个按 open_time 排序、去重的输出
+    - output_format='csv'：写 output_file（带表头，数值保持原始文本）
+    - output_format='cache'：写列式二进制缓存 output_file + '.cache'（见 kline_cache），不写CSV；
+      使用时仍传不带 .cache 的 output_file，如 kline_cache.read_klines(output_file) / load_columns(output_file)、
+      parallel_sweep.run_sweep(output_file, ...)，没有CSV时缓存本身就是数据
+    内存占用只与分块大小有关，与天数无关
+    """
     zip_files = sorted(glob.glob(os.path.join(input_dir, '*.zip')))
-    temp_dir = os.path.join(input_dir, 'temp_unzip')
-    os.makedirs(temp_dir, exist_ok=True)
-    csv_files = []
-    # 解压所有zip文件到临时目录
-    for zip_file in zip_files:
-        with zipfile.ZipFile(zip_file, 'r') as zip_ref:
-            for file_name in zip_ref.namelist():
-                if file_name.endswith('.csv'):
-                    out_path = os.path.join(temp_dir, os.path.basename(file_name))
-                    with zip_ref.open(file_name) as source, open(out_path, 'wb') as target:
-                        target.write(source.read())
-                    csv_files.append(out_path)
-    if not csv_files:
+    if not zip_files:
         print("没有找到任何csv数据")
-        return
-    # # 合并所有csv文件
-    # all_dataframes = []
-    # for csv_file in sorted(csv_files):
-    #     # 保留原始列名
-    #     df = pd.read_csv(csv_file, low_memory=False)
-    #     all_dataframes.append(df)
-    
-    # # 合并所有数据
-    # merged_df = pd.concat(all_dataframes, ignore_index=True)
-    
-    # # 按照时间顺序排序（假设第一列是时间戳）
-    # if 'open_time' in merged_df.columns:
-    #     merged_df = merged_df.sort_values(by='open_time')
-    # elif merged_df.shape[1] >= 1:
-    #     # 如果没有列名，假设第一列是时间
-    #     merged_df = merged_df.sort_values(by=merged_df.columns[0])
-    
-    # # 重置索引
-    # merged_df = merged_df.reset_index(drop=True)
-    
-    # # 保存时保留列名
-    # merged_df.to_csv(output_file, index=False)
-    # print(f"合并完成，输出文件：{output_file}")
+        return 0
+    rows = merge_rows(zip_files)
+
+    if output_format == 'cache':
+        path = output_file + '.cache'
+        schema = write_cache(_row_chunks(rows), path)
+        count = schema['rows']
+    else:
+        count = 0
+        tmp = output_file + '.part'
+        with open(tmp, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(KLINE_COLUMNS)
+            for row in rows:
+                writer.writerow(row[:len(KLINE_COLUMNS)])
+                count += 1
+        os.replace(tmp, output_file)
+        path = output_file
+    print(f"合并完成，共 {count} 行，输出：{path}")
+    return count
+
 
 if __name__ == "__main__":
     merge_csv_files()
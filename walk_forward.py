@@ -0,0 +1,180 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from kline_cache import ensure_cache, load_columns
+from position_engine import open_signals, hysteresis_positions, position_pnl
+from sweep_engine import rolling_zscore, v1_positions, pnl_matrix, sharpe_ratios
+
+# 滚动 / 扩展窗口的 walk-forward 优化：
+# 每个训练窗口按 METRIC 选出最佳参数，用它在紧接着的测试窗口上交易，各测试窗口的 pnl 拼成一条样本外曲线
+# z_score 和所有参数组合的持仓 / pnl 对整段历史只计算一次（都是因果计算，不会用到未来数据），各窗口只做切片；
+# 测试窗口第一根K线沿用所选参数在窗口前一根K线的持仓（相当于该参数一直在运行）
+CSV_FILE = 'klineData.csv'
+STRATEGY = 'V2'
+M_VALUES = [4, 8, 12, 16, 20, 24, 28, 32, 36, 40, 44, 48, 52, 56, 60]
+VALUES_A = [0.6, 0.8, 1.0, 1.2, 1.4]     # V1: N_values；V2: z_open_values
+VALUES_B = [0.1, 0.2, 0.3, 0.4, 0.5]     # V1: z_open_values；V2: z_close_values
+FOLDS = 20
+TRAIN_BARS = 24 * 90
+TEST_BARS = None        # None 表示把训练窗口之后的数据平均分成 FOLDS 份
+EXPANDING = False       # True：训练窗口从第一根K线开始
+METRIC = 'sharpe_ratio'
+WORKERS = None
+OUTPUT_DIR = 'kline'
+
+WF_METRICS = ['final_cpnl', 'sharpe_ratio']
+
+_close = None
+
+
+def _load_data(csv_file):
+    global _close
+    _close = load_columns(csv_file, ['close'])['close']
+
+
+def make_folds(n, folds=FOLDS, train_bars=TRAIN_BARS, test_bars=TEST_BARS, expanding=EXPANDING):
+    """
+    返回 [(train_start, train_end, test_start, test_end)]，区间左闭右开
+    test_bars 为 None 时把 [train_bars, n) 平均分成 folds 份，最后一份包含余数；
+    指定 test_bars 时每份都是 test_bars 根（最后一份不超过 n），之后剩下的K线不参与测试
+    """
+    if train_bars >= n:
+        raise ValueError(f'train_bars ({train_bars}) must be smaller than the number of bars ({n})')
+    derived = test_bars is None
+    if derived:
+        test_bars = (n - train_bars) // folds
+    if test_bars <= 0:
+        raise ValueError('not enough bars for the requested folds')
+    result = []
+    for k in range(folds):
+        test_start = train_bars + k * test_bars
+        if test_start >= n:
+            break
+        test_end = n if derived and k == folds - 1 else min(test_start + test_bars, n)
+        train_start = 0 if expanding else test_start - train_bars
+        result.append((train_start, test_start, test_start, test_end))
+    return result
+
+
+def combo_pnl(close, strategy, M, values_a, values_b):
+    """
+    固定 M，整段历史上所有 (a, b) 组合的 pnl，返回 (K, n) 矩阵，行顺序为 a -> b
+    """
+    close = np.asarray(close, dtype=np.float64)
+    zscore = rolling_zscore(close, M)
+    if strategy == 'V1':
+        # a 为 N，b 为 z_open
+        pnl = np.empty((len(values_a), len(values_b), len(close)))
+        for j, z_open in enumerate(values_b):
+            signal = open_signals(zscore, M, z_open)[0]
+            pnl[:, j] = pnl_matrix(close, v1_positions(signal, values_a))
+        return pnl.reshape(-1, len(close))
+    if strategy == 'V2':
+        z_open = np.repeat(np.asarray(values_a, dtype=np.float64), len(values_b))
+        z_close = np.tile(np.asarray(values_b, dtype=np.float64), len(values_a))
+        return position_pnl(close, hysteresis_positions(zscore, M, z_open, z_close))['pnl']
+    raise ValueError(f'unknown strategy: {strategy}')
+
+
+def window_scores(pnl, start, end, metric=METRIC):
+    """
+    每个组合在 [start, end) 上的指标，NaN 视为最差
+    """
+    window = pnl[:, start:end]
+    if metric == 'final_cpnl':
+        scores = np.cumsum(window, axis=1)[:, -1]
+    elif metric == 'sharpe_ratio':
+        scores = sharpe_ratios(window)
+    else:
+        raise ValueError(f'metric must be one of {WF_METRICS}, got {metric}')
+    return np.where(np.isnan(scores), -np.inf, scores)
+
+
+def _run_M(task):
+    strategy, M, values_a, values_b, folds, metric = task
+    pnl = combo_pnl(_close, strategy, M, values_a, values_b)
+    best = []
+    for train_start, train_end, test_start, test_end in folds:
+        scores = window_scores(pnl, train_start, train_end, metric)
+        k = int(np.argmax(scores))
+        best.append((scores[k], k, pnl[k, test_start:test_end].copy()))
+    return best
+
+
+def walk_forward(csv_file=CSV_FILE, strategy=STRATEGY, M_values=M_VALUES, values_a=VALUES_A, values_b=VALUES_B,
+                 folds=FOLDS, train_bars=TRAIN_BARS, test_bars=TEST_BARS, expanding=EXPANDING,
+                 metric=METRIC, workers=WORKERS):
+    """
+    返回 (fold_df, oos_df)
+    - fold_df：每个窗口的区间、选中的参数、训练集指标、测试集 final_cpnl / sharpe_ratio
+    - oos_df：拼接后的样本外 open_time / close / fold / pnl / cpnl
+    按 M 分任务并行：每个进程对一个 M 算出所有组合的 pnl，再对所有窗口选出该 M 下的最佳组合
+    """
+    if metric not in WF_METRICS:
+        raise ValueError(f'metric must be one of {WF_METRICS}, got {metric}')
+    workers = workers or os.cpu_count() or 1
+    ensure_cache(csv_file)
+    cols = load_columns(csv_file, ['open_time', 'close'])
+    fold_ranges = make_folds(len(cols['close']), folds, train_bars, test_bars, expanding)
+    tasks = [(strategy, M, list(values_a), list(values_b), fold_ranges, metric) for M in M_values]
+
+    start_time = time.perf_counter()
+    if workers == 1:
+        _load_data(csv_file)
+        per_M = list(map(_run_M, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_load_data, initargs=(csv_file,)) as executor:
+            per_M = list(executor.map(_run_M, tasks))
+    elapsed = time.perf_counter() - start_time
+
+    names = ('N', 'z_open') if strategy == 'V1' else ('z_open', 'z_close')
+    combos = [(a, b) for a in values_a for b in values_b]
+    fold_rows, oos_pnl, oos_fold = [], [], []
+    for f, (train_start, train_end, test_start, test_end) in enumerate(fold_ranges):
+        # 各 M 中训练集指标最高的，相同时取靠前的 M
+        m = max(range(len(M_values)), key=lambda i: (per_M[i][f][0], -i))
+        score, k, test_pnl = per_M[m][f]
+        fold_rows.append({
+            'fold': f,
+            'train_start': int(cols['open_time'][train_start]),
+            'train_end': int(cols['open_time'][train_end - 1]),
+            'test_start': int(cols['open_time'][test_start]),
+            'test_end': int(cols['open_time'][test_end - 1]),
+            'M': M_values[m],
+            names[0]: combos[k][0],
+            names[1]: combos[k][1],
+            'train_' + metric: score,
+            'test_final_cpnl': np.cumsum(test_pnl)[-1],
+            'test_sharpe_ratio': sharpe_ratios(test_pnl[None, :])[0] if len(test_pnl) > 1 else 0.0,
+        })
+        oos_pnl.append(test_pnl)
+        oos_fold.append(np.full(len(test_pnl), f))
+
+    first, last = fold_ranges[0][2], fold_ranges[-1][3]
+    pnl = np.concatenate(oos_pnl)
+    oos_df = pd.DataFrame({
+        'open_time': np.asarray(cols['open_time'][first:last]),
+        'close': np.asarray(cols['close'][first:last]),
+        'fold': np.concatenate(oos_fold),
+        'pnl': pnl,
+        'cpnl': np.cumsum(pnl),
+    })
+    print(f"walk-forward 完成：{len(fold_ranges)} 个窗口 x {len(M_values) * len(combos)} 组参数，用时 {elapsed:.2f}s")
+    return pd.DataFrame(fold_rows), oos_df
+
+
+if __name__ == "__main__":
+    fold_df, oos_df = walk_forward()
+    print(fold_df.to_string(index=False))
+    oos_sharpe = sharpe_ratios(oos_df['pnl'].to_numpy()[None, :])[0]
+    print(f"\n样本外累计PNL = {oos_df['cpnl'].iloc[-1]:.6f}，Sharpe Ratio = {oos_sharpe:.2f}")
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    fold_file = os.path.join(OUTPUT_DIR, f'walk_forward_folds_{STRATEGY}.csv')
+    oos_file = os.path.join(OUTPUT_DIR, f'walk_forward_oos_{STRATEGY}.csv')
+    fold_df.to_csv(fold_file, index=False)
+    oos_df.to_csv(oos_file, index=False)
+    print(f"窗口结果已保存到: {fold_file}")
+    print(f"样本外PNL已保存到: {oos_file}")